@@ -3,7 +3,7 @@ import os
 from os import path as ospath, mkdir, system, getenv
 from logging import INFO, ERROR, FileHandler, StreamHandler, basicConfig, getLogger
 from traceback import format_exc
-from asyncio import Queue, Lock
+from multiprocessing import cpu_count
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from pyrogram import Client
@@ -25,13 +25,9 @@ load_dotenv('config.env')
 
 ani_cache = {
     'fetch_animes': True,
-    'ongoing': set(),
-    'completed': set()
 }
 ffpids_cache = list()
 
-ffLock = Lock()
-ffQueue = Queue()
 ff_queued = dict()
 
 class Var:
@@ -45,6 +41,7 @@ class Var:
     OWNER_ID = int(getenv("OWNER_ID", "123456789"))  # <-- Add your Telegram ID here
     RSS_ITEMS = getenv("RSS_ITEMS", "").split()
     RSS_TOR = getenv("RSS_TOR", "").split()
+    RSS_SEEN = int(getenv("RSS_SEEN", "1000")) # Seen GUIDs remembered per feed
     FSUB_CHATS = list(map(int, getenv('FSUB_CHATS').split()))
     BACKUP_CHANNEL = getenv("BACKUP_CHANNEL") or ""
     MAIN_CHANNEL = int(getenv("MAIN_CHANNEL"))
@@ -59,6 +56,10 @@ class Var:
     BOT_USERNAME = getenv("BOT_USERNAME", "") # exact username without @
     
     SEND_SCHEDULE = getenv("SEND_SCHEDULE", "False").lower() == "true"
+    ANILIST_CACHE_SIZE = int(getenv("ANILIST_CACHE_SIZE", "512"))
+    ANILIST_TTL = int(getenv("ANILIST_TTL", "86400")) # Serve cached AniList data fresh for this long
+    ANILIST_STALE = int(getenv("ANILIST_STALE", "604800")) # then stale while refreshing for this long
+    ANILIST_BATCH = int(getenv("ANILIST_BATCH", "10")) # Searches packed into one GraphQL request
     BRAND_UNAME = getenv("BRAND_UNAME", "@username")
     SECOND_BRAND = getenv("SECOND_BRAND", "AnimeToki")
     FFCODE_1080 = getenv("FFCODE_1080") or """ffmpeg -i '{}' -progress '{}' -preset veryfast -c:v libx264 -s 1920x1080 -pix_fmt yuv420p -crf 30 -c:a libopus -b:a 32k -c:s copy -map 0 -ac 2 -ab 32k -vbr 2 -level 3.1 '{}' -y"""
@@ -66,8 +67,51 @@ class Var:
     FFCODE_480 = getenv("FFCODE_480") or """ffmpeg -i '{}' -progress '{}' -preset superfast -c:v libx264 -s 854x480 -pix_fmt yuv420p -crf 30 -c:a libopus -b:a 32k -c:s copy -map 0 -ac 2 -ab 32k -vbr 2 -level 3.1 '{}' -y"""
     FFCODE_360 = getenv("FFCODE_360") or """ffmpeg -i '{}' -progress '{}' -preset superfast -c:v libx264 -s 640x360 -pix_fmt yuv420p -crf 30 -c:a libopus -b:a 32k -c:s copy -map 0 -ac 2 -ab 32k -vbr 2 -level 3.1 '{}' -y"""
     QUALS = getenv("QUALS", "720 1080").split()
+    FF_SEGMENTS = int(getenv("FF_SEGMENTS", "0")) # Parallel segments per single-rendition encode, 0/1 = off
+    FF_SEG_MIN = int(getenv("FF_SEG_MIN", "120")) # Minimum seconds of video per segment
+    REMOTE_ENCODE = getenv("REMOTE_ENCODE", "False").lower() == "true" # Hand encodes to `python -m bot.worker` processes
+    JOB_SHARE = getenv("JOB_SHARE", "encode/shared") # Directory shared by the bot & workers for sources and outputs
+    JOB_LEASE = int(getenv("JOB_LEASE", "60")) # Seconds a worker owns a job without a heartbeat
+    JOB_RETRIES = int(getenv("JOB_RETRIES", "3"))
+    JOB_POLL = float(getenv("JOB_POLL", "3"))
+    TOR_STREAM = getenv("TOR_STREAM", "False").lower() == "true" # Encode while the torrent downloads
+    TOR_STALL = int(getenv("TOR_STALL", "600")) # Give up a stream after this many seconds without a new piece
+    FF_MULTI = getenv("FF_MULTI", "True").lower() == "true" # Encode all QUALS from a single decode
+    FF_SLOTS = int(getenv("FF_SLOTS") or max(1, cpu_count() // 8)) # Concurrent encodes, x264 already threads each one
+
+    THREAD_WORKERS = int(getenv("THREAD_WORKERS") or min(64, cpu_count() * 4)) # Shared pool behind sync_to_async
+    PROC_WORKERS = int(getenv("PROC_WORKERS", "0")) # Process pool for CPU-bound work, 0 to disable
+
+    TG_GLOBAL_RATE = int(getenv("TG_GLOBAL_RATE", "25")) # Bot API calls per second across all chats
+    TG_CHAT_RATE = float(getenv("TG_CHAT_RATE", "1")) # Calls per second in a private chat
+    TG_GROUP_RATE = int(getenv("TG_GROUP_RATE", "20")) # Calls per minute in a group or channel
+    TG_RETRIES = int(getenv("TG_RETRIES", "5"))
+    TG_CHAT_CACHE = int(getenv("TG_CHAT_CACHE", "10000")) # Per-chat rate buckets kept in memory
+
+    PROGRESS_INTERVAL = int(getenv("PROGRESS_INTERVAL", "5")) # Minimum seconds between status edits
+    PROGRESS_DASHBOARD = getenv("PROGRESS_DASHBOARD", "False").lower() == "true" # One status message per chat for all jobs
+    STATS_TTL = int(getenv("STATS_TTL", "10"))
+
+    HTTP_LIMIT = int(getenv("HTTP_LIMIT", "100"))
+    HTTP_PER_HOST = int(getenv("HTTP_PER_HOST", "10"))
+    HTTP_TIMEOUT = int(getenv("HTTP_TIMEOUT", "60"))
 
     DRIVE_FOLDER_ID = getenv("DRIVE_FOLDER_ID", "")
+    DRIVE_API_URL = getenv("DRIVE_API_URL", "https://www.googleapis.com") # Point at a fake Drive for testing
+    DRIVE_TOKEN = getenv("DRIVE_TOKEN", "") # Static bearer token instead of SERVICE_ACCOUNT_JSON
+    DRIVE_CHUNK = int(getenv("DRIVE_CHUNK", str(32 * 1024 * 1024)))
+    DRIVE_RETRIES = int(getenv("DRIVE_RETRIES", "8"))
+    DRIVE_WORKERS = int(getenv("DRIVE_WORKERS", "2"))
+    UPLOAD_WORKERS = int(getenv("UPLOAD_WORKERS", "4")) # Parallel backup copies & Drive uploads
+    DELIVERY_BATCH = int(getenv("DELIVERY_BATCH", "200")) # Buffered delivery marks per bulk write
+    DELIVERY_FLUSH = float(getenv("DELIVERY_FLUSH", "5")) # Seconds between delivery flushes
+    DELIVERY_CACHE = int(getenv("DELIVERY_CACHE", "50000")) # Recent (user, anime) hits kept in memory
+    DELIVERY_TTL = int(getenv("DELIVERY_TTL", "0")) # Forget deliveries after N seconds, 0 = never
+    FILE_CACHE_SIZE = int(getenv("FILE_CACHE_SIZE", "2048")) # FILE_STORE msg_id -> file_id entries
+    FSUB_TTL = int(getenv("FSUB_TTL", "600")) # Seconds a confirmed fsub membership is trusted
+    BENCH_SECONDS = int(getenv("BENCH_SECONDS", "30")) # Reference clip length for /bench
+    BENCH_SSIM = float(getenv("BENCH_SSIM", "0.95")) # Minimum SSIM a recommended profile must reach
+    BENCH_SIZE = float(getenv("BENCH_SIZE", "1.1")) # Max bitrate vs the current profile
     AS_DOC = getenv("AS_DOC", "True").lower() == "true"
     THUMB = getenv("THUMB", "https://te.legra.ph/file/621c8d40f9788a1db7753.jpg")
     AUTO_DEL = getenv("AUTO_DEL", "True").lower() == "true"
@@ -1,16 +1,23 @@
-from asyncio import create_task, create_subprocess_exec, all_tasks, sleep as asleep
+from asyncio import create_task, create_subprocess_exec, all_tasks
 from aiofiles import open as aiopen
 from pyrogram import idle
 from pyrogram.filters import command, user
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from os import path as ospath, execl, kill
+from os import path as ospath, execl, kill, makedirs
 from sys import executable
 from signal import SIGKILL
 import base64
 
-from bot import bot, Var, bot_loop, sch, LOGS, ffQueue, ffLock, ffpids_cache, ff_queued
-from bot.core.auto_animes import fetch_animes, handle_start
-from bot.core.func_utils import clean_up, new_task
+from bot import bot, Var, bot_loop, sch, LOGS, ffpids_cache
+from bot.core.auto_animes import fetch_animes, handle_start, get_animes
+from bot.core.func_utils import clean_up, new_task, executor
+from bot.core.http_utils import http
+from bot.core.database import db
+from bot.core.anime_index import aniidx
+from bot.core.deliveries import deliveries
+from bot.core.autodelete import autodel
+from bot.core.pipeline import pipeline
+from bot.core.reporter import rep
 from bot.modules.up_posts import upcoming_animes
 
 # ----------------------
@@ -88,6 +95,10 @@ async def restart_cmd(client, message):
             except (OSError, ProcessLookupError):
                 LOGS.error("Killing Process Failed!")
                 continue
+    await rep.drain()
+    await deliveries.flush()
+    await http.close()
+    executor.shutdown()
     await (await create_subprocess_exec('python3', 'update.py')).wait()
     async with aiopen(".restartmsg", "w") as f:
         await f.write(f"{rmessage.chat.id}\n{rmessage.id}\n")
@@ -105,35 +116,29 @@ async def restart():
         except Exception as e:
             LOGS.error(e)
 
-# ----------------------
-# FF queue loop
-# ----------------------
-async def queue_loop():
-    LOGS.info("Queue Loop Started!")
-    while True:
-        if not ffQueue.empty():
-            post_id = await ffQueue.get()
-            await asleep(1.5)
-            ff_queued[post_id].set()
-            await asleep(1.5)
-            async with ffLock:
-                ffQueue.task_done()
-        await asleep(10)
-
 # ----------------------
 # Main function
 # ----------------------
 async def main():
     sch.add_job(upcoming_animes, "cron", hour=0, minute=30)
+    await db.ensure_indexes()
+    await aniidx.load()
+    if Var.REMOTE_ENCODE:
+        makedirs(Var.JOB_SHARE, exist_ok=True)
     await bot.start()
+    await autodel.load()
     await restart()
     LOGS.info('Auto Anime Bot Started!')
     sch.start()
-    bot_loop.create_task(queue_loop())
+    await pipeline.resume(get_animes)
     await fetch_animes()
     await idle()
     LOGS.info('Auto Anime Bot Stopped!')
+    await rep.drain()
     await bot.stop()
+    await deliveries.flush()
+    await http.close()
+    executor.shutdown()
     for task in all_tasks():
         task.cancel()
     await clean_up()
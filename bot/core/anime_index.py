@@ -0,0 +1,59 @@
+from anitopy import parse
+
+from bot import Var, LOGS
+from .database import db
+
+META_FIELDS = ('_id', 'msg_id', 'names', 'files')
+
+class AnimeIndex:
+    """
+    In-memory copy of which (anime_id, episode, quality) renditions are done,
+    loaded from Mongo in one pass at boot and written through on every save.
+    Feed titles that were already handled map straight to their anime id, so
+    re-seen entries are skipped without touching AniList or Mongo.
+    """
+    def __init__(self):
+        self.__done = {}
+        self.__names = {}
+        self.__running = set()
+
+    async def load(self):
+        self.__done.clear()
+        self.__names.clear()
+        async for doc in db.iterAnimes():
+            ani_id = doc['_id']
+            for ep, quals in doc.items():
+                if ep not in META_FIELDS and isinstance(quals, dict):
+                    self.__done.setdefault(ani_id, {})[ep] = {qual for qual, ok in quals.items() if ok}
+            for name in doc.get('names', []):
+                self.__names[name] = ani_id
+        LOGS.info(f"Anime Index Loaded: {len(self.__done)} Animes, {len(self.__names)} Titles")
+
+    def lookup(self, name):
+        """
+        Return (anime_id, episode) for a feed title seen before, else None.
+        """
+        if (ani_id := self.__names.get(name)) is None:
+            return None
+        return ani_id, parse(name).get("episode_number")
+
+    def is_done(self, ani_id, ep):
+        quals = self.__done.get(ani_id, {}).get(str(ep), set())
+        return all(qual in quals for qual in Var.QUALS)
+
+    def claim(self, ani_id, ep):
+        if (ani_id, str(ep)) in self.__running:
+            return False
+        self.__running.add((ani_id, str(ep)))
+        return True
+
+    def release(self, ani_id, ep):
+        self.__running.discard((ani_id, str(ep)))
+
+    async def mark(self, ani_id, ep, qual, post_id=None, name=None, file=None):
+        await db.saveAnime(ani_id, ep, qual, post_id, name, file)
+        self.__done.setdefault(ani_id, {}).setdefault(str(ep), set()).add(qual)
+        if name:
+            self.__names[name] = ani_id
+
+aniidx = AnimeIndex()
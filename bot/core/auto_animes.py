@@ -1,21 +1,32 @@
 # bot/core/auto_animes.py
 import asyncio
-from asyncio import Event, sleep
+from asyncio import sleep
 from os import path as ospath
 from aiofiles.os import remove as aioremove
 from traceback import format_exc
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 import base64
 
-from bot import bot, bot_loop, Var, ani_cache, ffQueue, ffLock, ff_queued
-from .tordownload import TorDownloader
-from bot.core.database import db
-from .func_utils import getfeed, editMessage, sendMessage, convertBytes
+from bot import bot, bot_loop, Var, ani_cache
+from .tordownload import TorDownloader, TorStreamer
+from .func_utils import editMessage, sendMessage, convertBytes, sync_to_async
 from .text_utils import TextEditor
-from .ffencoder import FFEncoder
+from .rss_utils import rss
+from .ffencoder import FFEncoder, ff_mergeable
+from .ffpool import ffpool
+from .anime_index import aniidx
+from .deliveries import deliveries
+from .file_cache import filecache
+from .autodelete import autodel
+from .encode_cache import enccache, source_fingerprint
+from .jobqueue import jobq
+from .pipeline import pipeline
 from .tguploader import TgUploader
+from .gdrive_uploader import upload_to_drive
 from .reporter import rep
 
+upSem = asyncio.Semaphore(Var.UPLOAD_WORKERS)
+
 btn_formatter = {
     '1080': '1080p',
     '720': '720p',
@@ -30,43 +41,54 @@ async def fetch_animes():
     while True:
         await asyncio.sleep(60)
         if ani_cache.get('fetch_animes'):
-            for link in Var.RSS_ITEMS:
-                if (info := await getfeed(link, 0)):
-                    bot_loop.create_task(get_animes(info.title, info.link))
+            for info in await rss.poll(Var.RSS_ITEMS):
+                bot_loop.create_task(get_animes(info.title, info.link))
 
 # ----------------------
 # Main function to download, encode, upload and create buttons
 # ----------------------
 async def get_animes(name, torrent, force=False):
+    post_id, enc_task, streamer, claimed, job = None, None, None, None, None
     try:
+        # Titles handled before resolve locally, no AniList or Mongo round trip
+        if not force and (seen := aniidx.lookup(name)) and aniidx.is_done(*seen):
+            return
+
         aniInfo = TextEditor(name)
         await aniInfo.load_anilist()
         ani_id, ep_no = aniInfo.adata.get('id'), aniInfo.pdata.get("episode_number")
-
-        if ani_id not in ani_cache.get('ongoing', set()):
-            ani_cache.setdefault('ongoing', set()).add(ani_id)
-        elif not force:
+        if not ani_id:
+            # Unresolved titles would all share one index entry and pipeline job
+            await rep.report(f"AniList Lookup Failed, Skipped!\n\n{name}", "error")
             return
 
-        if not force and ani_id in ani_cache.get('completed', set()):
+        if not force and aniidx.is_done(ani_id, ep_no):
             return
-
-        ani_data = await db.getAnime(ani_id)
-        qual_data = ani_data.get(ep_no) if ani_data else None
-        if not force and qual_data and all(qual_data.get(q) for q in Var.QUALS):
+        if not aniidx.claim(ani_id, ep_no):
             return
+        claimed = (ani_id, ep_no)
 
         if "[Batch]" in name:
             await rep.report(f"Torrent Skipped!\n\n{name}", "warning")
             return
 
-        await rep.report(f"New Anime Torrent Found!\n\n{name}", "info")
-
-        post_msg = await bot.send_photo(
-            Var.MAIN_CHANNEL,
-            photo=await aniInfo.get_poster(),
-            caption=await aniInfo.get_caption()
-        )
+        # Every completed stage is persisted, a restart resumes from the last one
+        job = await pipeline.open(ani_id, ep_no, name, torrent, force)
+        if job.get('attempts') == 1:
+            await rep.report(f"New Anime Torrent Found!\n\n{name}", "info")
+
+        post_msg = None
+        if job.get('post_id'):
+            post_msg = await bot.get_messages(Var.MAIN_CHANNEL, message_ids=job.get('post_id'))
+            if not post_msg or post_msg.empty:
+                post_msg = None
+        if post_msg is None:
+            post_msg = await bot.send_photo(
+                Var.MAIN_CHANNEL,
+                photo=await aniInfo.get_poster(),
+                caption=await aniInfo.get_caption()
+            )
+            await job.posted_msg(post_msg.id)
 
         await asyncio.sleep(1.5)
         stat_msg = await sendMessage(
@@ -74,60 +96,89 @@ async def get_animes(name, torrent, force=False):
             f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Downloading...</i>"
         )
 
+        # Stream the torrent straight into the encoder while it downloads
+        dl = job.download()
+        if not dl and Var.TOR_STREAM:
+            streamer = TorStreamer("./downloads")
+            if dl := await streamer.start(torrent):
+                await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Downloading & Streaming to Encoder...</i>")
+                bot_loop.create_task(record_stream(job, streamer))
+            else:
+                await streamer.stop()
+                streamer = None
+
         # Retry download up to 3 times if incomplete
-        dl = None
-        for attempt in range(3):
+        for attempt in range(0 if streamer or dl else 3):
             dl = await TorDownloader("./downloads").download(torrent, name)
             if dl and ospath.exists(dl):
                 break
             await rep.report(f"Download failed or incomplete. Retrying ({attempt+1}/3)...", "warning")
             await asyncio.sleep(5)
 
-        if not dl or not ospath.exists(dl):
+        if not streamer and (not dl or not ospath.exists(dl)):
             await rep.report(f"File Download Incomplete after 3 retries, Skipping", "error")
             await stat_msg.delete()
             return
+        if not streamer and job.get('dl') != dl:
+            await job.downloaded(dl)
 
         post_id = post_msg.id
-        ffEvent = Event()
-        ff_queued[post_id] = ffEvent
-        if ffLock.locked():
-            await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Queued to Encode...</i>")
-            await rep.report("Added Task to Queue...", "info")
-        await ffQueue.put(post_id)
-        await ffEvent.wait()
-
-        await ffLock.acquire()
         btns = []
+        filenames = {qual: await aniInfo.get_upname(qual) for qual in Var.QUALS}
 
+        # Renditions this job already finished, or made before from the same source & profile, are reused
+        fp = None if streamer else await sync_to_async(source_fingerprint, dl)
+        ready = {qual: got for qual in Var.QUALS if (got := job.ready(qual))}
+        ready.update(await enccache.lookup(fp, [qual for qual in Var.QUALS if qual not in ready]))
+        upq = asyncio.Queue()
         for qual in Var.QUALS:
-            filename = await aniInfo.get_upname(qual)
-            await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Ready to Encode...</i>")
-            await asyncio.sleep(1.5)
-            await rep.report(f"Starting Encode ({qual})...", "info")
-
-            try:
-                out_path = await FFEncoder(stat_msg, dl, filename, qual).start_encode()
-            except Exception as e:
-                await rep.report(f"Error: {e}, Cancelled, Retry Again!", "error")
-                await stat_msg.delete()
-                ffLock.release()
-                return
-
-            await rep.report(f"✅ Successfully Compressed ({qual}). Uploading...", "info")
-            await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{filename}</i></b>\n\n<i>Ready to Upload...</i>")
-            await asyncio.sleep(1.5)
-
-            try:
-                msg = await TgUploader(stat_msg).upload(out_path, qual)
-            except Exception as e:
-                await rep.report(f"Error: {e}, Cancelled, Retry Again!", "error")
-                await stat_msg.delete()
-                ffLock.release()
-                return
+            if qual in ready:
+                upq.put_nowait((qual, ready[qual]))
+        encodes = {qual: filename for qual, filename in filenames.items() if qual not in ready}
+
+        # Remote workers bring their own encode slots
+        if encodes and not Var.REMOTE_ENCODE:
+            if ffpool.is_full:
+                await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Queued to Encode...</i>")
+                await rep.report("Added Task to Queue...", "info")
+            await ffpool.acquire(post_id)
+
+        # Encode and upload run as two stages, so quality N uploads while N+1 encodes
+        enc_task = bot_loop.create_task(encode_stage(stat_msg, name, dl, encodes, upq, streamer, torrent, job))
+        enc_task.add_done_callback(lambda _: ffpool.release(post_id))
+        up_msg = None
+
+        while (item := await upq.get()) is not None:
+            qual, out_path = item
+            filename = filenames[qual]
+            if isinstance(out_path, dict):
+                msg_id, ref, out_path = out_path['msg_id'], out_path['ref'], None
+                filecache.put(msg_id, ref)
+                await rep.report(f"♻️ Reusing Uploaded {qual} File, Skipped Encode & Upload...", "info")
+            else:
+                if up_msg is None:
+                    up_msg = await sendMessage(Var.MAIN_CHANNEL, f"‣ <b>Anime Name :</b> <b><i>{filename}</i></b>\n\n<i>Ready to Upload...</i>")
+                else:
+                    await editMessage(up_msg, f"‣ <b>Anime Name :</b> <b><i>{filename}</i></b>\n\n<i>Ready to Upload...</i>")
+                await asyncio.sleep(1.5)
 
-            await rep.report(f"✅ Successfully Uploaded {qual} File to Tg...", "info")
-            msg_id = msg.id
+                try:
+                    msg = await TgUploader(up_msg).upload(out_path, qual)
+                except Exception as e:
+                    await rep.report(f"Error: {e}, Cancelled, Retry Again!", "error")
+                    enc_task.cancel()
+                    await stat_msg.delete()
+                    await up_msg.delete()
+                    return
+
+                await rep.report(f"✅ Successfully Uploaded {qual} File to Tg...", "info")
+                msg_id = msg.id
+                ref = filecache.put_message(msg)
+                # A streamed source is only complete (and hashable) once its encode is done
+                if fp is None and dl and ospath.exists(dl):
+                    fp = await sync_to_async(source_fingerprint, dl)
+                await enccache.save(fp, qual, msg_id, ref)
+            await job.uploaded(qual, msg_id, ref)
 
             # Base64 button payload
             payload = f"anime-{ani_id}-{msg_id}-{qual}"
@@ -137,7 +188,7 @@ async def get_animes(name, torrent, force=False):
             # Telegram buttons
             btn_label = btn_formatter.get(qual, qual)
             new_btn = InlineKeyboardButton(
-                f"{btn_label} - {convertBytes(msg.document.file_size)}",
+                f"{btn_label} - {convertBytes(ref['size'])}",
                 url=link
             )
             if len(btns) != 0 and len(btns[-1]) == 1:
@@ -151,25 +202,121 @@ async def get_animes(name, torrent, force=False):
             )
 
             # Save in DB
-            await db.saveAnime(ani_id, ep_no, qual, msg_id)
+            await aniidx.mark(ani_id, ep_no, qual, msg_id, name, (msg_id, ref))
+
+            # Backup, Drive & cleanup task
+            if out_path:
+                bot_loop.create_task(extra_utils(msg_id, out_path, fp, qual))
 
-            # Backup & cleanup task
-            bot_loop.create_task(extra_utils(msg_id, out_path))
+        if up_msg:
+            await up_msg.delete()
+        if not await enc_task:
+            await stat_msg.delete()
+            return
+        if streamer:
+            await streamer.stop()
 
-        ffLock.release()
         await stat_msg.delete()
 
         # Cleanup original torrent file
         if ospath.exists(dl):
             await aioremove(dl)
             await rep.report(f"Deleted original torrent file: {dl}", "info")
+        await job.posted()
 
-        ani_cache.setdefault('completed', set()).add(ani_id)
+    except Exception:
+        await rep.report(format_exc(), "error")
+    finally:
+        if enc_task and not enc_task.done():
+            enc_task.cancel()
+        ffpool.release(post_id)
+        if claimed:
+            aniidx.release(*claimed)
+        if streamer:
+            await streamer.stop()
 
+
+# ----------------------
+# Persist a streamed download once the torrent has fully arrived
+# ----------------------
+async def record_stream(job, streamer):
+    try:
+        if path := await streamer.wait():
+            await job.downloaded(path)
     except Exception:
         await rep.report(format_exc(), "error")
 
 
+# ----------------------
+# Encode stage: feeds finished renditions to the upload stage
+# ----------------------
+async def encode_stage(stat_msg, name, dl, filenames, upq, streamer=None, torrent=None, job=None):
+    encoder = None
+
+    async def encoded(qual, out_path):
+        if job:
+            await job.encoded(qual, out_path)
+        await upq.put((qual, out_path))
+
+    # Only the first pass can read the live torrent stream, later ones use the finished file
+    source = streamer.stream() if streamer and not Var.REMOTE_ENCODE else None
+    try:
+        if not filenames:
+            return True
+
+        if Var.REMOTE_ENCODE:
+            if streamer and not await streamer.wait():
+                await rep.report("Torrent Stream Ended Before Download Completed, Cancelled!", "error")
+                return False
+            await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Queued for a Remote Encoder...</i>")
+            if not (out_paths := await jobq.run(stat_msg, name, dl, torrent, filenames)):
+                await rep.report("Remote Encode Failed, Cancelled, Retry Again!", "error")
+                return False
+            for qual, out_path in out_paths.items():
+                await rep.report(f"✅ Successfully Compressed ({qual}) Remotely. Uploading...", "info")
+                await encoded(qual, out_path)
+            return True
+
+        # Single decode for every rendition when all FFCODE templates allow it
+        if Var.FF_MULTI and ff_mergeable(list(filenames)):
+            await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Ready to Encode...</i>")
+            await asyncio.sleep(1.5)
+            await rep.report(f"Starting Encode ({', '.join(filenames)}) in One Pass...", "info")
+            encoder = FFEncoder(stat_msg, dl, list(filenames.values()), list(filenames), source)
+            if not (out_paths := await encoder.start_encode()):
+                await rep.report("Encode Failed, Cancelled, Retry Again!", "error")
+                return False
+            for qual, out_path in out_paths.items():
+                await rep.report(f"✅ Successfully Compressed ({qual}). Uploading...", "info")
+                await encoded(qual, out_path)
+            return True
+
+        for qual, filename in filenames.items():
+            await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Ready to Encode...</i>")
+            await asyncio.sleep(1.5)
+            await rep.report(f"Starting Encode ({qual})...", "info")
+            if streamer and source is None and not await streamer.wait():
+                await rep.report("Torrent Stream Ended Before Download Completed, Cancelled!", "error")
+                return False
+            encoder = FFEncoder(stat_msg, dl, filename, qual, source)
+            source = None
+            if not (out_path := await encoder.start_encode()):
+                await rep.report(f"Encode Failed ({qual}), Cancelled, Retry Again!", "error")
+                return False
+            await rep.report(f"✅ Successfully Compressed ({qual}). Uploading...", "info")
+            await encoded(qual, out_path)
+        return True
+    except asyncio.CancelledError:
+        if encoder:
+            await encoder.cancel_encode()
+        raise
+    except Exception as e:
+        await rep.report(f"Error: {e}, Cancelled, Retry Again!", "error")
+        return False
+    finally:
+        upq.put_nowait(None)
+
+
 # ----------------------
 # /start handler logic
 # ----------------------
@@ -186,7 +333,7 @@ async def handle_start(client, message, start_payload):
     user_id = message.from_user.id
 
     # Check if already got this anime
-    if await db.get_user_anime(user_id, ani_id, qual):
+    if await deliveries.has(user_id, ani_id, qual):
         # Send website link on second hit
         if getattr(Var, "WEBSITE", None):
             await message.reply(f"🎬 You already received this anime!\nVisit: {Var.WEBSITE}")
@@ -194,38 +341,21 @@ async def handle_start(client, message, start_payload):
             await message.reply("🎬 You already received this anime!")
         return
 
-    # First hit → get file
-    msg = await client.get_messages(Var.FILE_STORE, message_ids=msg_id)
-    if not msg:
+    # First hit → get file, usually straight from the file_id cache
+    ref = await filecache.get(msg_id, ani_id)
+    if not ref:
         await message.reply("File not found!")
         return
 
     protect = getattr(Var, "TG_PROTECT_CONTENT", False)
 
-    if msg.document:
-        sent = await client.send_document(
-            chat_id=message.chat.id,
-            document=msg.document.file_id,
-            protect_content=protect
-        )
-    elif msg.video:
-        sent = await client.send_video(
-            chat_id=message.chat.id,
-            video=msg.video.file_id,
-            protect_content=protect
-        )
-    elif msg.photo:
-        sent = await client.send_photo(
-            chat_id=message.chat.id,
-            photo=msg.photo.file_id,
-            protect_content=protect
-        )
-    else:
+    if ref['media'] not in ('document', 'video', 'photo'):
         await message.reply("File type not supported!")
         return
+    sent = await filecache.send(message.chat.id, ref, protect=protect)
 
-    # Mark in DB
-    await db.mark_user_anime(user_id, ani_id, qual)
+    # Mark in DB, flushed in bulk behind the request
+    deliveries.mark(user_id, ani_id, qual)
 
     # Auto-delete PM message after DEL_TIMER
     if getattr(Var, "AUTO_DEL", False):
@@ -235,34 +365,46 @@ async def handle_start(client, message, start_payload):
                 chat_id=message.chat.id,
                 text=f"⚠️ This file will be auto-deleted in {timer} seconds!"
             )
-            await asyncio.sleep(timer)
-            await sent.delete()
-            await notify.delete()
-            await client.send_message(
-                chat_id=message.chat.id,
-                text="⏳ File has been auto-deleted!"
-            )
-            await rep.report(f"Auto-deleted file for user {user_id} ({qual})", "info")
+            await autodel.schedule(message.chat.id, [sent.id, notify.id], timer, "⏳ File has been auto-deleted!")
         except Exception:
-            await rep.report(f"Failed auto-delete for user {user_id} ({qual})", "error")
+            await rep.report(f"Failed to schedule auto-delete for user {user_id} ({qual})", "error")
 
 
 # ----------------------
 # Extra utils: backup & local cleanup
 # ----------------------
-async def extra_utils(msg_id, out_path):
+async def extra_utils(msg_id, out_path, fp=None, qual=None):
     try:
-        # Backup to other channels
+        # Backup to other channels and Drive, a few at a time
         msg = await bot.get_messages(Var.FILE_STORE, message_ids=msg_id)
+        jobs = []
         if Var.BACKUP_CHANNEL and Var.BACKUP_CHANNEL != "0":
-            for chat_id in Var.BACKUP_CHANNEL.split():
-                try:
-                    await msg.copy(int(chat_id))
-                except Exception:
-                    pass
+            jobs.extend(backup_copy(msg, int(chat_id)) for chat_id in Var.BACKUP_CHANNEL.split())
+        if Var.DRIVE_FOLDER_ID:
+            jobs.append(drive_backup(out_path, fp, qual))
+        await asyncio.gather(*jobs)
         # Delete local encoded file after backup
         if ospath.exists(out_path):
             await aioremove(out_path)
             await rep.report(f"Deleted local encoded file: {out_path}", "info")
     except Exception:
         await rep.report(format_exc(), "error")
+
+
+async def backup_copy(msg, chat_id):
+    async with upSem:
+        try:
+            await msg.copy(chat_id)
+        except Exception:
+            pass
+
+
+async def drive_backup(out_path, fp=None, qual=None):
+    async with upSem:
+        try:
+            drive_link = await upload_to_drive(out_path)
+        except Exception:
+            return
+    if drive_link:
+        await enccache.save_drive(fp, qual, drive_link)
+        await sendMessage(Var.LOG_CHANNEL, f"✅ <b>{ospath.basename(out_path)}</b> also uploaded to <b>Google Drive</b>\n\n🔗 {drive_link}")
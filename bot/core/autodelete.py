@@ -0,0 +1,77 @@
+from time import time
+from heapq import heappush, heappop
+from asyncio import Event, TimeoutError as AsyncTimeoutError, wait_for
+
+from bot import bot, bot_loop, LOGS
+from .database import db
+from .tglimiter import tglimit
+
+class AutoDeleter:
+    """
+    One timer for every pending auto-delete. Deletions live in a heap
+    ordered by due time and are mirrored in Mongo, so they survive restarts;
+    whatever falls due together is removed with one delete_messages per chat.
+    """
+    def __init__(self):
+        self.__heap = []
+        self.__wake = Event()
+        self.__task = None
+
+    async def load(self):
+        count = 0
+        async for doc in db.getDeletions():
+            heappush(self.__heap, (doc['due'], str(doc['_id']), doc))
+            count += 1
+        if count:
+            LOGS.info(f"Resumed {count} Pending Auto Deletes")
+        self.__ensure()
+
+    async def schedule(self, chat_id, msg_ids, delay, notice=None):
+        doc = {'chat_id': chat_id, 'msg_ids': list(msg_ids), 'due': time() + delay, 'notice': notice}
+        doc['_id'] = await db.addDeletion(doc)
+        heappush(self.__heap, (doc['due'], str(doc['_id']), doc))
+        self.__wake.set()
+        self.__ensure()
+
+    def __ensure(self):
+        if self.__heap and (self.__task is None or self.__task.done()):
+            self.__task = bot_loop.create_task(self.__run())
+
+    async def __run(self):
+        while self.__heap:
+            self.__wake.clear()
+            if (delay := self.__heap[0][0] - time()) > 0:
+                try:
+                    # An earlier deletion scheduled meanwhile wakes the timer up
+                    await wait_for(self.__wake.wait(), delay)
+                except AsyncTimeoutError:
+                    pass
+                continue
+            due = []
+            while self.__heap and self.__heap[0][0] <= time():
+                due.append(heappop(self.__heap)[2])
+            try:
+                await self.__delete(due)
+            except Exception as e:
+                LOGS.error(f"Auto Delete Failed: {e}")
+
+    async def __delete(self, docs):
+        chats = {}
+        for doc in docs:
+            chats.setdefault(doc['chat_id'], []).extend(doc['msg_ids'])
+        for chat_id, msg_ids in chats.items():
+            # delete_messages takes at most 100 ids per call
+            for i in range(0, len(msg_ids), 100):
+                try:
+                    await tglimit.call(chat_id, bot.delete_messages, chat_id, msg_ids[i:i+100])
+                except Exception as e:
+                    LOGS.error(f"Auto Delete in {chat_id} Failed: {e}")
+        for doc in docs:
+            if doc.get('notice'):
+                try:
+                    await tglimit.call(doc['chat_id'], bot.send_message, doc['chat_id'], doc['notice'])
+                except Exception as e:
+                    LOGS.error(f"Auto Delete Notice in {doc['chat_id']} Failed: {e}")
+        await db.removeDeletions([doc['_id'] for doc in docs])
+
+autodel = AutoDeleter()
@@ -1,6 +1,9 @@
 # bot/core/database.py
+from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorClient  
-from bot import Var  
+from pymongo import ASCENDING, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from bot import Var, LOGS
 
 class MongoDB:
     def __init__(self, uri, database_name):
@@ -8,6 +11,12 @@ class MongoDB:
         self.__db = self.__client[database_name]
         self.__animes = self.__db.animes[Var.BOT_TOKEN.split(':')[0]]
         self.__user_animes = self.__db.user_animes  # collection for per-user tracking
+        self.__feeds = self.__db.feeds[Var.BOT_TOKEN.split(':')[0]]  # RSS poll state per feed link
+        self.__anilist = self.__db.anilist  # AniList metadata cache, shared by all bots
+        self.__deletions = self.__db.deletions[Var.BOT_TOKEN.split(':')[0]]  # pending auto-deletes
+        self.__encodes = self.__db.encodes[Var.BOT_TOKEN.split(':')[0]]  # source+profile -> stored encode
+        self.__jobs = self.__db.jobs[Var.BOT_TOKEN.split(':')[0]]  # encode jobs for remote workers
+        self.__pipeline = self.__db.pipeline[Var.BOT_TOKEN.split(':')[0]]  # resumable per-episode job state
 
     # ----------------------
     # Anime quality storage
@@ -16,20 +25,28 @@ class MongoDB:
         botset = await self.__animes.find_one({'_id': ani_id})
         return botset or {}
 
-    async def saveAnime(self, ani_id, ep, qual, post_id=None):
-        quals = (await self.getAnime(ani_id)).get(ep, {qual: False for qual in Var.QUALS})
-        quals[qual] = True
+    async def saveAnime(self, ani_id, ep, qual, post_id=None, name=None, file=None):
+        update = {'$set': {f"{ep}.{qual}": True}}
+        if post_id:
+            update['$set']["msg_id"] = post_id
+        if file:
+            msg_id, ref = file
+            update['$set'][f"files.{msg_id}"] = ref
+        if name:
+            update['$addToSet'] = {'names': name}
         await self.__animes.update_one(
             {'_id': ani_id},
-            {'$set': {ep: quals}},
+            update,
             upsert=True
         )
-        if post_id:
-            await self.__animes.update_one(
-                {'_id': ani_id},
-                {'$set': {"msg_id": post_id}},
-                upsert=True
-            )
+
+    async def getFileRef(self, ani_id, msg_id):
+        ani_id = int(ani_id) if str(ani_id).isdigit() else ani_id
+        doc = await self.__animes.find_one({'_id': ani_id}, {f"files.{msg_id}": 1})
+        return (doc or {}).get('files', {}).get(str(msg_id))
+
+    def iterAnimes(self):
+        return self.__animes.find({})
 
     # ----------------------
     # Per-user hit tracking (per-quality)
@@ -39,36 +56,192 @@ class MongoDB:
         Return True if user already got this anime quality.
         If qual is None, return the whole doc.
         """
-        doc = await self.__user_animes.find_one({'user_id': user_id, 'anime_id': ani_id})
-        if not doc:
-            return False if qual else None
         if qual:
-            return doc.get("got_files", {}).get(qual, False)
-        return doc
+            return await self.__user_animes.find_one(
+                {'user_id': user_id, 'anime_id': ani_id, f'got_files.{qual}': True},
+                {'_id': 1}
+            ) is not None
+        return await self.__user_animes.find_one({'user_id': user_id, 'anime_id': ani_id})
 
     async def mark_user_anime(self, user_id, ani_id, qual):
         """
         Mark that user received this anime quality.
         Stores per-quality flags inside got_files.
         """
-        doc = await self.__user_animes.find_one({'user_id': user_id, 'anime_id': ani_id})
-        if doc:
-            got_files = doc.get("got_files", {})
-        else:
-            got_files = {}
-        got_files[qual] = True
         await self.__user_animes.update_one(
             {'user_id': user_id, 'anime_id': ani_id},
-            {'$set': {'got_files': got_files}},
+            {'$set': {f'got_files.{qual}': True, 'ts': datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def bulkMarkUserAnimes(self, marks):
+        """
+        Flush buffered marks, {(user_id, ani_id): {qual, ...}}, in one round trip.
+        """
+        now = datetime.utcnow()
+        await self.__user_animes.bulk_write([
+            UpdateOne(
+                {'user_id': user_id, 'anime_id': ani_id},
+                {'$set': {**{f'got_files.{qual}': True for qual in quals}, 'ts': now}},
+                upsert=True
+            ) for (user_id, ani_id), quals in marks.items()
+        ], ordered=False)
+
+    # ----------------------
+    # RSS feed poll state
+    # ----------------------
+    async def getFeedState(self, link):
+        return await self.__feeds.find_one({'_id': link}) or {}
+
+    async def saveFeedState(self, link, guids, etag=None, modified=None):
+        await self.__feeds.update_one(
+            {'_id': link},
+            {'$set': {'guids': guids, 'etag': etag, 'modified': modified}},
             upsert=True
         )
 
+    # ----------------------
+    # Pending auto-deletes
+    # ----------------------
+    async def addDeletion(self, doc):
+        return (await self.__deletions.insert_one(doc)).inserted_id
+
+    def getDeletions(self):
+        return self.__deletions.find({})
+
+    async def removeDeletions(self, ids):
+        await self.__deletions.delete_many({'_id': {'$in': ids}})
+
+    # ----------------------
+    # Encode result cache
+    # ----------------------
+    async def getEncodes(self, keys):
+        return await self.__encodes.find({'_id': {'$in': keys}}).to_list(length=None)
+
+    async def saveEncode(self, key, data):
+        await self.__encodes.update_one({'_id': key}, {'$set': data}, upsert=True)
+
+    # ----------------------
+    # Remote encode job queue
+    # ----------------------
+    async def pushJob(self, doc):
+        return (await self.__jobs.insert_one(doc)).inserted_id
+
+    async def getJob(self, job_id):
+        return await self.__jobs.find_one({'_id': job_id}) or {}
+
+    async def claimJob(self, worker, now, lease):
+        """
+        Atomically hand the oldest queued job, or one whose lease ran out, to `worker`.
+        """
+        return await self.__jobs.find_one_and_update(
+            {'$or': [{'status': 'queued'}, {'status': 'running', 'lease': {'$lt': now}}]},
+            {'$set': {'status': 'running', 'worker': worker, 'lease': now + lease, 'beat': now}, '$inc': {'attempts': 1}},
+            sort=[('created', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def beatJob(self, job_id, worker, now, lease, progress=None):
+        res = await self.__jobs.update_one(
+            {'_id': job_id, 'worker': worker, 'status': 'running'},
+            {'$set': {'lease': now + lease, 'beat': now, 'progress': progress}}
+        )
+        return res.matched_count == 1
+
+    async def endJob(self, job_id, worker, status, **fields):
+        res = await self.__jobs.update_one(
+            {'_id': job_id, 'worker': worker, 'status': 'running'},
+            {'$set': {'status': status, **fields}}
+        )
+        return res.matched_count == 1
+
+    async def cancelJob(self, job_id):
+        await self.__jobs.update_one({'_id': job_id, 'status': {'$in': ['queued', 'running']}},
+                                     {'$set': {'status': 'cancelled'}})
+
+    # ----------------------
+    # Resumable pipeline state
+    # ----------------------
+    async def getJobState(self, key):
+        return await self.__pipeline.find_one({'_id': key})
+
+    async def newJobState(self, doc):
+        await self.__pipeline.replace_one({'_id': doc['_id']}, doc, upsert=True)
+
+    async def saveJobState(self, key, fields):
+        await self.__pipeline.update_one({'_id': key}, {'$set': fields})
+
+    def getOpenJobStates(self):
+        return self.__pipeline.find({'stage': {'$nin': ['posted', 'failed']}}).sort('created', ASCENDING)
+
+    # ----------------------
+    # AniList metadata cache
+    # ----------------------
+    async def getAniMeta(self, key):
+        return await self.__anilist.find_one({'keys': key}) or {}
+
+    async def saveAniMeta(self, key, data, ts):
+        await self.__anilist.update_one(
+            {'_id': data['id']},
+            {'$set': {'data': data, 'ts': ts}, '$addToSet': {'keys': key}},
+            upsert=True
+        )
+
+    # ----------------------
+    # Startup index migration
+    # ----------------------
+    async def ensure_indexes(self):
+        try:
+            await self.__user_animes.create_index(
+                [('user_id', ASCENDING), ('anime_id', ASCENDING)], unique=True, name='user_anime'
+            )
+        except DuplicateKeyError:
+            # Older read-modify-write marks could race into duplicates, fold them first
+            await self.__dedupe_user_animes()
+            await self.__user_animes.create_index(
+                [('user_id', ASCENDING), ('anime_id', ASCENDING)], unique=True, name='user_anime'
+            )
+        await self.__anilist.create_index('keys', name='anilist_keys')
+        await self.__jobs.create_index([('status', ASCENDING), ('created', ASCENDING)], name='job_claim')
+        # Finished pipeline jobs are kept a week for inspection
+        await self.__pipeline.create_index('done_at', expireAfterSeconds=7 * 86400, name='pipeline_done')
+        await self.__ensure_ttl()
+        LOGS.info("MongoDB Indexes Ensured !")
+
+    async def __ensure_ttl(self):
+        # Delivery marks older than DELIVERY_TTL are compacted away, 0 keeps them forever
+        indexes = await self.__user_animes.index_information()
+        if not Var.DELIVERY_TTL:
+            if 'user_anime_ttl' in indexes:
+                await self.__user_animes.drop_index('user_anime_ttl')
+            return
+        try:
+            await self.__user_animes.create_index('ts', expireAfterSeconds=Var.DELIVERY_TTL, name='user_anime_ttl')
+        except OperationFailure:
+            await self.__db.command('collMod', self.__user_animes.name,
+                                    index={'name': 'user_anime_ttl', 'expireAfterSeconds': Var.DELIVERY_TTL})
+
+    async def __dedupe_user_animes(self):
+        dups = self.__user_animes.aggregate([
+            {'$group': {'_id': {'u': '$user_id', 'a': '$anime_id'}, 'ids': {'$push': '$_id'}, 'n': {'$sum': 1}}},
+            {'$match': {'n': {'$gt': 1}}},
+        ])
+        async for dup in dups:
+            got_files = {}
+            async for doc in self.__user_animes.find({'_id': {'$in': dup['ids']}}):
+                got_files.update({q: True for q, v in doc.get('got_files', {}).items() if v})
+            keep, *drop = dup['ids']
+            await self.__user_animes.update_one({'_id': keep}, {'$set': {'got_files': got_files}})
+            await self.__user_animes.delete_many({'_id': {'$in': drop}})
+            LOGS.warning(f"Merged {len(drop)} Duplicate user_animes Docs for {dup['_id']}")
+
     # ----------------------
     # Drop all anime data
     # ----------------------
     async def reboot(self):
         await self.__animes.drop()
         await self.__user_animes.drop()
+        await self.__feeds.drop()
 
 # Single instance
 db = MongoDB(Var.MONGO_URI, "FZAutoAnimes")
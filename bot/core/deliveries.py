@@ -0,0 +1,65 @@
+from asyncio import Lock, sleep as asleep
+from collections import OrderedDict
+
+from bot import Var, bot_loop, LOGS
+from .database import db
+
+class DeliveryTracker:
+    """
+    Write-behind tracking of which user got which anime quality. Marks are
+    answered from memory at once and flushed to Mongo in bulk when the
+    buffer fills up or every few seconds, whichever comes first.
+    """
+    def __init__(self, batch, interval, size):
+        self.__batch = batch
+        self.__interval = interval
+        self.__size = size
+        self.__recent = OrderedDict()
+        self.__pending = {}
+        self.__lock = Lock()
+        self.__task = None
+
+    def __remember(self, key, quals):
+        self.__recent[key] = quals
+        self.__recent.move_to_end(key)
+        while len(self.__recent) > self.__size:
+            self.__recent.popitem(last=False)
+
+    async def has(self, user_id, ani_id, qual):
+        key = (user_id, str(ani_id))
+        if (quals := self.__recent.get(key)) is None:
+            doc = await db.get_user_anime(user_id, key[1]) or {}
+            quals = {q for q, ok in doc.get('got_files', {}).items() if ok}
+            quals |= self.__pending.get(key, set())
+            self.__remember(key, quals)
+        else:
+            self.__recent.move_to_end(key)
+        return qual in quals
+
+    def mark(self, user_id, ani_id, qual):
+        key = (user_id, str(ani_id))
+        self.__remember(key, self.__recent.get(key, set()) | {qual})
+        self.__pending.setdefault(key, set()).add(qual)
+        if len(self.__pending) >= self.__batch:
+            bot_loop.create_task(self.flush())
+        if self.__task is None or self.__task.done():
+            self.__task = bot_loop.create_task(self.__run())
+
+    async def __run(self):
+        while self.__pending:
+            await asleep(self.__interval)
+            await self.flush()
+
+    async def flush(self):
+        async with self.__lock:
+            if not self.__pending:
+                return
+            marks, self.__pending = self.__pending, {}
+            try:
+                await db.bulkMarkUserAnimes(marks)
+            except Exception as e:
+                LOGS.error(f"Delivery Flush Failed, Retrying Later: {e}")
+                for key, quals in marks.items():
+                    self.__pending.setdefault(key, set()).update(quals)
+
+deliveries = DeliveryTracker(Var.DELIVERY_BATCH, Var.DELIVERY_FLUSH, Var.DELIVERY_CACHE)
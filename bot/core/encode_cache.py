@@ -0,0 +1,52 @@
+from hashlib import sha1
+from os import path as ospath
+
+from bot import LOGS
+from .database import db
+from .ffencoder import ffargs
+
+SAMPLE = 1 << 20
+
+def source_fingerprint(path):
+    """
+    Cheap content key for a downloaded source: its size plus a hash of
+    1 MiB from the start, middle and end, instead of hashing gigabytes.
+    """
+    size = ospath.getsize(path)
+    digest = sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - SAMPLE // 2), max(0, size - SAMPLE)}):
+            f.seek(offset)
+            digest.update(f.read(SAMPLE))
+    return f"{size:x}-{digest.hexdigest()}"
+
+def profile_key(qual):
+    return sha1((ffargs.get(qual) or "").encode()).hexdigest()[:16]
+
+def encode_key(fp, qual):
+    return f"{fp}:{qual}:{profile_key(qual)}"
+
+class EncodeCache:
+    """
+    Maps (source fingerprint, exact ffmpeg profile) to the FILE_STORE message
+    and Drive copy made from it, so the same release arriving again (another
+    feed, /addtask) is re-posted instead of re-encoded and re-uploaded.
+    """
+    async def lookup(self, fp, quals):
+        if not fp:
+            return {}
+        keys = {encode_key(fp, qual): qual for qual in quals}
+        hits = {keys[doc['_id']]: doc for doc in await db.getEncodes(list(keys)) if doc.get('msg_id')}
+        if hits:
+            LOGS.info(f"Encode Cache Hit for {', '.join(hits)} of {fp}")
+        return hits
+
+    async def save(self, fp, qual, msg_id, ref):
+        if fp:
+            await db.saveEncode(encode_key(fp, qual), {'msg_id': msg_id, 'ref': ref})
+
+    async def save_drive(self, fp, qual, link):
+        if fp:
+            await db.saveEncode(encode_key(fp, qual), {'drive': link})
+
+enccache = EncodeCache()
@@ -0,0 +1,140 @@
+from re import compile as re_compile, search
+from time import time
+from json import dumps
+from socket import gethostname
+from os import path as ospath, cpu_count
+from asyncio import create_subprocess_shell, gather, sleep as asleep
+from asyncio.subprocess import PIPE, DEVNULL
+
+import psutil
+
+from bot import Var, LOGS
+from .ffencoder import ffargs, FFProgress
+from .ffpool import ffpool
+from .func_utils import JobSpace
+
+PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium')
+PRESET_RE = re_compile(r"-preset\s+\S+")
+
+def candidates(qual):
+    """
+    The configured template for `qual` plus one variant per x264 preset,
+    each also tried with `-threads 0` when the template sets no threads.
+    """
+    base = ffargs[qual]
+    found = {'current': base}
+    for preset in PRESETS:
+        if PRESET_RE.search(base):
+            variant = PRESET_RE.sub(f"-preset {preset}", base, count=1)
+        else:
+            variant = base.replace("-c:v ", f"-preset {preset} -c:v ", 1)
+        if variant != base:
+            found[preset] = variant
+        if "-threads" not in variant:
+            found[f"{preset}+threads"] = variant.replace("-c:v ", "-threads 0 -c:v ", 1)
+    return found
+
+async def run(cmd):
+    proc = await create_subprocess_shell(cmd, stdout=DEVNULL, stderr=PIPE)
+    _, stderr = await proc.communicate()
+    return proc.returncode, stderr.decode(errors='ignore')
+
+async def make_reference(space, source, seconds):
+    ref = space.join("ref.mkv")
+    if source:
+        # Skip the opening so the clip is real episode content, not a cold open card
+        cmd = f"ffmpeg -y -ss 120 -t {seconds} -i '{source}' -map 0 -c copy '{ref}'"
+    else:
+        cmd = (f"ffmpeg -y -f lavfi -i testsrc2=size=1920x1080:rate=24000/1001 -f lavfi -i sine=frequency=440 "
+               f"-t {seconds} -c:v libx264 -preset ultrafast -crf 12 -pix_fmt yuv420p -c:a aac '{ref}'")
+    code, err = await run(cmd)
+    if code != 0 or not ospath.exists(ref):
+        raise Exception(f"Reference Clip Failed: {err[-500:]}")
+    return ref
+
+async def quality(ref, out):
+    # Scale the rendition back to the reference size so SSIM/PSNR compare like with like
+    code, err = await run(f"ffmpeg -i '{out}' -i '{ref}' -lavfi "
+                          f"\"[0:v][1:v]scale2ref=flags=bicubic[d][r];[d]split[d1][d2];[r]split[r1][r2];[d1][r1]ssim;[d2][r2]psnr\" -f null -")
+    ssim = search(r"SSIM .*All:([\d.]+)", err)
+    psnr = search(r"PSNR .*average:([\d.]+|inf)", err)
+    return float(ssim.group(1)) if ssim else 0.0, float(psnr.group(1)) if psnr else 0.0
+
+async def bench(space, ref, seconds, name, template):
+    out = space.join(f"{name}.mkv")
+    progress = FFProgress()
+    proc = await create_subprocess_shell(template.format(ref, "pipe:1", out), stdout=PIPE, stderr=DEVNULL)
+    start, cpu = time(), 0.0
+
+    async def sample():
+        nonlocal cpu
+        try:
+            ps = psutil.Process(proc.pid)
+            while proc.returncode is None:
+                # x264 spreads over threads of one process, sum the shell and ffmpeg
+                cpu = max(cpu, sum(sum(p.cpu_times()[:2]) for p in [ps, *ps.children(recursive=True)]))
+                await asleep(0.5)
+        except psutil.Error:
+            pass
+
+    _, _, code = await gather(progress.feed(proc.stdout), sample(), proc.wait())
+    wall = time() - start
+    if code != 0 or not ospath.exists(out):
+        return None
+    frames = int(frames) if (frames := progress.latest.get('frame', '')).isdigit() else 0
+    ssim, psnr = await quality(ref, out)
+    return {
+        'fps': round(frames / wall, 2),
+        'cpu': round(cpu / wall / (cpu_count() or 1) * 100, 1),
+        'kbps': round(ospath.getsize(out) * 8 / seconds / 1000, 1),
+        'ssim': round(ssim, 4),
+        'psnr': round(psnr, 2),
+        'ffcode': template,
+    }
+
+def recommend(results):
+    """
+    Per quality, the fastest candidate scoring at least BENCH_SSIM against
+    the reference and no more than BENCH_SIZE times the current bitrate.
+    """
+    picks = {}
+    for qual, runs in results.items():
+        if not (current := runs.get('current')):
+            continue
+        ok = {name: r for name, r in runs.items()
+              if r['ssim'] >= Var.BENCH_SSIM and r['kbps'] <= current['kbps'] * Var.BENCH_SIZE}
+        best = max(ok, key=lambda name: ok[name]['fps']) if ok else 'current'
+        picks[qual] = {'profile': best, **runs[best]}
+    return picks
+
+async def run_bench(quals, source=None, seconds=None, on_step=None, job_id=None):
+    """
+    Benchmark every candidate profile of `quals` on this host and return
+    (results, recommendations, report path). Runs inside an encode slot like
+    any other encode, so it never oversubscribes the host.
+    """
+    seconds = seconds or Var.BENCH_SECONDS
+    results = {}
+    # Every bench needs its own pool id, a shared one would let one run release the other's slot
+    job_id = job_id or f"bench:{time()}"
+    await ffpool.acquire(job_id)
+    try:
+        async with JobSpace("encode", prefix="bench_") as space:
+            ref = await make_reference(space, source, seconds)
+            for qual in (q for q in quals if ffargs.get(q)):
+                results[qual] = {}
+                for name, template in candidates(qual).items():
+                    if on_step:
+                        await on_step(qual, name)
+                    if res := await bench(space, ref, seconds, f"{qual}_{name}", template):
+                        results[qual][name] = res
+                    else:
+                        LOGS.warning(f"Bench Profile {qual}/{name} Failed")
+    finally:
+        ffpool.release(job_id)
+    picks = recommend(results)
+    report = f"bench_{gethostname()}.json"
+    with open(report, "w") as f:
+        f.write(dumps({'host': gethostname(), 'cpus': cpu_count(), 'seconds': seconds,
+                       'results': results, 'recommended': picks}, indent=2))
+    return results, picks, report
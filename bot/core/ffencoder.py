@@ -1,16 +1,18 @@
-from re import findall 
+from re import compile as re_compile, DOTALL
 from math import floor
 from time import time
-from os import path as ospath
-from aiofiles import open as aiopen
-from aiofiles.os import remove as aioremove, rename as aiorename
-from shlex import split as ssplit
-from asyncio import sleep as asleep, gather, create_subprocess_shell, create_task
+from os import path as ospath, symlink
+from glob import glob
+from collections import deque
+from aiofiles.os import rename as aiorename
+from shlex import split as ssplit, join as sjoin
+from asyncio import Event, gather, create_subprocess_shell, create_task
 from asyncio.subprocess import PIPE
 
 from bot import Var, bot_loop, ffpids_cache, LOGS
-from .func_utils import mediainfo, convertBytes, convertTime, sendMessage, editMessage
+from .func_utils import mediainfo, convertBytes, convertTime, sendMessage, JobSpace
 from .reporter import rep
+from .progress import hub
 
 ffargs = {
     '1080': Var.FFCODE_1080,
@@ -18,88 +20,323 @@ ffargs = {
     '480': Var.FFCODE_480,
 }
 
+# ffmpeg -i '{in}' -progress '{prog}' <output options> '{out}' -y
+FF_TEMPLATE = re_compile(r"^\s*ffmpeg\s+-i\s+'\{\}'\s+-progress\s+'\{\}'\s+(.+?)\s+'\{\}'\s+-y\s*$", DOTALL)
+
+def ff_outopts(qual, templates=None):
+    """
+    Return the output-side options of an FFCODE template, or None if the
+    template can't share its input decode with other renditions.
+    """
+    if not (match := FF_TEMPLATE.match((templates or ffargs).get(qual) or "")):
+        return None
+    opts = match.group(1)
+    if "'{}'" in opts or any(arg in ssplit(opts) for arg in ("-i", "-filter_complex", "-lavfi")):
+        return None
+    return opts
+
+def ff_mergeable(quals, templates=None):
+    return len(quals) > 1 and all(ff_outopts(qual, templates) for qual in quals)
+
+# Output options that only concern the video stream, dropped when audio/subs are muxed on their own
+VIDEO_OPTS = {'-preset', '-c:v', '-codec:v', '-vcodec', '-s', '-pix_fmt', '-crf', '-level', '-vf', '-filter:v',
+              '-tune', '-profile:v', '-x264-params', '-x265-params', '-b:v', '-maxrate', '-bufsize', '-g', '-r',
+              '-map', '-threads'}
+
+def ff_nonvideo(opts):
+    args, kept = iter(ssplit(opts)), []
+    for arg in args:
+        if arg in VIDEO_OPTS:
+            next(args, None)
+            continue
+        kept.append(arg)
+    return sjoin(kept)
+
+def ff_multicode(in_path, progress, outputs, templates=None):
+    ffcode = f"ffmpeg -y -i '{in_path}' -progress '{progress}'"
+    for qual, out_path in outputs.items():
+        ffcode += f" {ff_outopts(qual, templates)} '{out_path}'"
+    return ffcode
+
+class FFProgress:
+    """
+    Incremental parser for `ffmpeg -progress pipe:1`. Only the latest
+    key/value block is kept, and every consumer iterating over it gets each
+    new block as it completes, until ffmpeg ends.
+    """
+    def __init__(self):
+        self.latest = {}
+        self.ended = False
+        self.__version = 0
+        self.__changed = Event()
+
+    def __publish(self):
+        self.__version += 1
+        changed, self.__changed = self.__changed, Event()
+        changed.set()
+
+    async def feed(self, stream):
+        block = {}
+        try:
+            while line := await stream.readline():
+                key, _, value = line.decode(errors='ignore').strip().partition('=')
+                block[key] = value
+                if key == 'progress':
+                    self.latest, block = block, {}
+                    self.__publish()
+        finally:
+            self.close()
+
+    def set(self, block):
+        self.latest = block
+        self.__publish()
+
+    def close(self):
+        if not self.ended:
+            self.ended = True
+            self.__publish()
+
+    @property
+    def time_done(self):
+        us = self.latest.get('out_time_us') or self.latest.get('out_time_ms') or ''
+        return int(us) / 1000000 if us.isdigit() else 0
+
+    @property
+    def total_size(self):
+        return int(size) if (size := self.latest.get('total_size', '')).isdigit() else 0
+
+    async def __aiter__(self):
+        seen = 0
+        while True:
+            changed = self.__changed
+            if self.__version != seen:
+                seen = self.__version
+                if self.latest:
+                    yield self
+                if self.ended:
+                    return
+            else:
+                await changed.wait()
+
 class FFEncoder:
-    def __init__(self, message, path, name, qual):
+    def __init__(self, message, path, name, qual, source=None, profiles=None):
         self.__proc = None
+        self.__procs = []
+        self.__source = source
         self.is_cancelled = False
         self.message = message
-        self.__name = name
-        self.__qual = qual
+        self.__quals = list(qual) if isinstance(qual, (list, tuple)) else [qual]
+        self.__names = list(name) if isinstance(name, (list, tuple)) else [name]
+        self.__name = self.__names[0]
+        self.__qual = self.__quals[0]
+        # A remote job carries the bot's templates, a worker's own FFCODE_* may differ
+        self.__ffargs = profiles or ffargs
         self.dl_path = path
-        self.__total_time = None
-        self.out_path = ospath.join("encode", name)
-        self.__prog_file = 'prog.txt'
+        self.total_time = None
+        self.ffprogress = FFProgress()
+        self.__errlog = deque(maxlen=50)
+        self.out_path = ospath.join("encode", self.__name)
+        self.out_paths = {qual: ospath.join("encode", name) for qual, name in zip(self.__quals, self.__names)}
+        self.__tmp_paths = {}
         self.__start_time = time()
 
     async def progress(self):
-        self.__total_time = await mediainfo(self.dl_path, get_duration=True)
-        if isinstance(self.__total_time, str):
-            self.__total_time = 1.0
-        while not (self.__proc is None or self.is_cancelled):
-            async with aiopen(self.__prog_file, 'r+') as p:
-                text = await p.read()
-            if text:
-                time_done = floor(int(t[-1]) / 1000000) if (t := findall(r"out_time_ms=(\d+)", text)) else 1
-                ensize = int(s[-1]) if (s := findall(r"total_size=(\d+)", text)) else 0
-                
-                diff = time() - self.__start_time
-                speed = ensize / diff
-                percent = round((time_done/self.__total_time)*100, 2)
-                tsize = ensize / (max(percent, 0.01)/100)
-                eta = (tsize-ensize)/max(speed, 0.01)
-    
-                bar = floor(percent/8)*"█" + (12 - floor(percent/8))*"▒"
-                
-                progress_str = f"""<blockquote>‣ <b>Anime Name :</b> <b><i>{self.__name}</i></b></blockquote>
+        if self.total_time is None:
+            self.total_time = await mediainfo(self.dl_path, get_duration=True)
+        if isinstance(self.total_time, str):
+            self.total_time = 1.0
+        async for prog in self.ffprogress:
+            if self.is_cancelled:
+                break
+            time_done = floor(prog.time_done) or 1
+            ensize = prog.total_size
+
+            diff = time() - self.__start_time
+            speed = ensize / diff
+            percent = round((time_done/self.total_time)*100, 2)
+            tsize = ensize / (max(percent, 0.01)/100)
+            eta = (tsize-ensize)/max(speed, 0.01)
+
+            bar = floor(percent/8)*"█" + (12 - floor(percent/8))*"▒"
+
+            if len(self.__quals) > 1:
+                outs = "\n".join(f"    ‣ <b>{qual}p :</b> {convertBytes(ospath.getsize(tmp)) if ospath.exists(tmp) else '0 B'}" for qual, tmp in self.__tmp_paths.items())
+                encoded = f"""<blockquote>‣ <b>File(s) Encoding:</b> <code>{len(self.__quals)} in One Pass</code>
+{outs}</blockquote>"""
+            else:
+                encoded = f"<blockquote>‣ <b>File Encoding:</b> <code>{self.__qual}p</code></blockquote>"
+
+            progress_str = f"""<blockquote>‣ <b>Anime Name :</b> <b><i>{self.__name}</i></b></blockquote>
 <blockquote>‣ <b>Status :</b> <i>Encoding</i>
-    <code>[{bar}]</code> {percent}%</blockquote> 
+    <code>[{bar}]</code> {percent}%</blockquote>
 <blockquote>   ‣ <b>Size :</b> {convertBytes(ensize)} out of ~ {convertBytes(tsize)}
     ‣ <b>Speed :</b> {convertBytes(speed)}/s
     ‣ <b>Time Took :</b> {convertTime(diff)}
     ‣ <b>Time Left :</b> {convertTime(eta)}</blockquote>
-<blockquote>‣ <b>File(s) Encoded:</b> <code>{Var.QUALS.index(self.__qual)} / {len(Var.QUALS)}</code></blockquote>"""
-            
-                await editMessage(self.message, progress_str)
-                if (prog := findall(r"progress=(\w+)", text)) and prog[-1] == 'end':
-                    break
-            await asleep(8)
-    
-    async def start_encode(self):
-        if ospath.exists(self.__prog_file):
-            await aioremove(self.__prog_file)
-    
-        async with aiopen(self.__prog_file, 'w+'):
-            LOGS.info("Progress Temp Generated !")
-            pass
-        
-        dl_npath, out_npath = ospath.join("encode", "ffanimeadvin.mkv"), ospath.join("encode", "ffanimeadvout.mkv")
-        await aiorename(self.dl_path, dl_npath)
-        
-        ffcode = ffargs[self.__qual].format(dl_npath, self.__prog_file, out_npath)
-        
+{encoded}"""
+
+            hub.update(self.message, progress_str)
+
+    async def errlog(self, proc=None):
+        proc = proc or self.__proc
+        while line := await proc.stderr.readline():
+            self.__errlog.append(line.decode(errors='ignore').rstrip())
+
+    async def __segments(self):
+        """
+        Number of parallel segments to cut this encode into, 1 when it has to
+        run as one ffmpeg (streamed input, several renditions, a template that
+        can't be split, or an episode too short to be worth it).
+        """
+        if Var.FF_SEGMENTS < 2 or self.__source is not None or len(self.__quals) > 1 or not ff_outopts(self.__qual, self.__ffargs):
+            return 1
+        self.total_time = await mediainfo(self.dl_path, get_duration=True)
+        if isinstance(self.total_time, str) or not self.total_time:
+            return 1
+        return max(1, min(Var.FF_SEGMENTS, int(self.total_time // Var.FF_SEG_MIN)))
+
+    @staticmethod
+    async def __reap(proc):
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+
+    async def __run(self, ffcode, progress):
         LOGS.info(f'FFCode: {ffcode}')
-        self.__proc = await create_subprocess_shell(ffcode, stdout=PIPE, stderr=PIPE)
-        proc_pid = self.__proc.pid
-        ffpids_cache.append(proc_pid)
-        _, return_code = await gather(create_task(self.progress()), self.__proc.wait())
-        ffpids_cache.remove(proc_pid)
-        
-        await aiorename(dl_npath, self.dl_path)
-        
-        if self.is_cancelled:
+        proc = await create_subprocess_shell(ffcode, stdout=PIPE, stderr=PIPE)
+        self.__procs.append(proc)
+        ffpids_cache.append(proc.pid)
+        try:
+            _, _, return_code = await gather(progress.feed(proc.stdout), self.errlog(proc), proc.wait())
+        finally:
+            await self.__reap(proc)
+            ffpids_cache.remove(proc.pid)
+        return return_code
+
+    async def __encode_segments(self, space, in_path, out_path, count):
+        """
+        Cut the video at keyframes into `count` pieces, encode them side by
+        side with the same settings, then concat the pieces losslessly and mux
+        audio, subtitles and attachments from the source in one final pass.
+        """
+        opts = ff_outopts(self.__qual, self.__ffargs)
+        seg_time = self.total_time / count
+        if await self.__run(f"ffmpeg -y -i '{in_path}' -progress pipe:1 -map 0:v:0 -c copy -f segment "
+                            f"-segment_time {seg_time:.3f} -reset_timestamps 1 '{space.join('seg_%03d.mkv')}'", FFProgress()) != 0:
+            return 1
+        segs = sorted(glob(space.join("seg_*.mkv")))
+        encs = [space.join(f"enc_{i:03d}.mkv") for i in range(len(segs))]
+        progs = [FFProgress() for _ in segs]
+
+        async def collect(prog):
+            # Every segment's progress adds up into the encoder's own progress
+            async for _ in prog:
+                self.ffprogress.set({
+                    'out_time_us': str(int(sum(p.time_done for p in progs) * 1000000)),
+                    'total_size': str(sum(p.total_size for p in progs)),
+                    'progress': 'continue',
+                })
+
+        codes = await gather(*(self.__run(f"ffmpeg -y -i '{seg}' -progress pipe:1 {opts} '{enc}'", prog)
+                               for seg, enc, prog in zip(segs, encs, progs)),
+                             *(collect(prog) for prog in progs))
+        if self.is_cancelled or any(codes[:len(segs)]):
+            return 1
+
+        concat = space.join("concat.txt")
+        with open(concat, "w") as f:
+            # Concat resolves entries relative to the list file, which sits next to them
+            f.writelines(f"file '{ospath.basename(enc)}'\n" for enc in encs)
+        return await self.__run(f"ffmpeg -y -i '{in_path}' -f concat -safe 0 -i '{concat}' -progress pipe:1 "
+                                f"-map 1:v:0 -map 0 -map -0:v {ff_nonvideo(opts)} -c:v copy '{out_path}'", FFProgress())
+
+    async def start_encode(self):
+        """
+        Encode every requested quality from a single decode of the source.
+        Returns the output path for a single quality, or a {qual: path} dict
+        when several qualities were passed in.
+        """
+        try:
+            async with JobSpace("encode") as space:
+                # Each job links its input and writes its outputs inside its own workspace, so encodes never collide
+                self.__tmp_paths = {qual: space.join(f"out_{qual}.mkv") for qual in self.__quals}
+                if self.__source is None:
+                    dl_npath = space.join("in.mkv")
+                    symlink(ospath.abspath(self.dl_path), dl_npath)
+                else:
+                    # A streamed source is still being written by the torrent engine, feed ffmpeg through stdin instead
+                    dl_npath = "pipe:0"
+
+                if (segments := await self.__segments()) > 1:
+                    # Split one long encode across several ffmpegs so a single episode can use every core
+                    progress = create_task(self.progress())
+                    try:
+                        return_code = await self.__encode_segments(space, dl_npath, self.__tmp_paths[self.__qual], segments)
+                    finally:
+                        self.ffprogress.close()
+                        await progress
+                else:
+                    if len(self.__quals) > 1:
+                        ffcode = ff_multicode(dl_npath, "pipe:1", self.__tmp_paths, self.__ffargs)
+                    else:
+                        ffcode = self.__ffargs[self.__qual].format(dl_npath, "pipe:1", self.__tmp_paths[self.__qual])
+
+                    LOGS.info(f'FFCode: {ffcode}')
+                    self.__proc = await create_subprocess_shell(ffcode, stdin=PIPE if self.__source else None, stdout=PIPE, stderr=PIPE)
+                    proc_pid = self.__proc.pid
+                    ffpids_cache.append(proc_pid)
+                    try:
+                        _, _, _, return_code, _ = await gather(create_task(self.progress()), self.ffprogress.feed(self.__proc.stdout),
+                                                               self.errlog(), self.__proc.wait(), self.feed())
+                    finally:
+                        # A cancelled encode must not outlive its workspace or leave a stale pid for /restart to kill
+                        await self.__reap(self.__proc)
+                        ffpids_cache.remove(proc_pid)
+
+                if self.is_cancelled:
+                    return
+
+                if return_code != 0:
+                    await rep.report("\n".join(self.__errlog), "error")
+                    return
+
+                for qual, tmp_path in self.__tmp_paths.items():
+                    if ospath.exists(tmp_path):
+                        await aiorename(tmp_path, self.out_paths[qual])
+                return self.out_paths if len(self.__quals) > 1 else self.out_path
+        finally:
+            self.ffprogress.close()
+            hub.finish(self.message)
+
+    async def feed(self):
+        if self.__source is None:
             return
-        
-        if return_code == 0:
-            if ospath.exists(out_npath):
-                await aiorename(out_npath, self.out_path)
-            return self.out_path
-        else:
-            await rep.report((await self.__proc.stderr.read()).decode().strip(), "error")
-            
+        try:
+            async for chunk in self.__source:
+                if self.is_cancelled:
+                    break
+                self.__proc.stdin.write(chunk)
+                await self.__proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            await rep.report(f"Stream Feed Failed: {e}", "error")
+            try:
+                self.__proc.kill()
+            except:
+                pass
+        finally:
+            self.__proc.stdin.close()
+
     async def cancel_encode(self):
         self.is_cancelled = True
-        if self.__proc is not None:
+        for proc in [self.__proc, *self.__procs]:
+            if proc is None:
+                continue
             try:
-                self.__proc.kill()
+                proc.kill()
             except:
                 pass
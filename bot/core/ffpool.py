@@ -0,0 +1,75 @@
+from asyncio import Event, CancelledError
+from collections import deque
+
+from bot import Var, LOGS, ff_queued
+
+class FFPool:
+    def __init__(self, slots):
+        self.__slots = max(1, slots)
+        self.__active = set()
+        self.__waiting = deque()
+        self.__idle = Event()
+        self.__idle.set()
+
+    @property
+    def slots(self):
+        return self.__slots
+
+    @property
+    def active(self):
+        return len(self.__active)
+
+    @property
+    def waiting(self):
+        return len(self.__waiting)
+
+    @property
+    def is_full(self):
+        return len(self.__active) >= self.__slots
+
+    async def acquire(self, job_id):
+        """
+        Wait for a free encode slot. Jobs are dispatched in FIFO order the
+        moment a running job releases its slot.
+        """
+        event = Event()
+        ff_queued[job_id] = event
+        self.__idle.clear()
+        if not self.__waiting and not self.is_full:
+            self.__active.add(job_id)
+            event.set()
+        else:
+            self.__waiting.append(job_id)
+            LOGS.info(f"Encode Job {job_id} Queued ({len(self.__waiting)} Waiting)")
+        try:
+            await event.wait()
+        except CancelledError:
+            self.release(job_id)
+            raise
+
+    def release(self, job_id):
+        if job_id is None or ff_queued.pop(job_id, None) is None:
+            return
+        if job_id in self.__active:
+            self.__active.discard(job_id)
+        else:
+            try:
+                self.__waiting.remove(job_id)
+            except ValueError:
+                pass
+        self.__dispatch()
+
+    def __dispatch(self):
+        while self.__waiting and not self.is_full:
+            job_id = self.__waiting.popleft()
+            if (event := ff_queued.get(job_id)) is None:
+                continue
+            self.__active.add(job_id)
+            event.set()
+        if not self.__active and not self.__waiting:
+            self.__idle.set()
+
+    async def join(self):
+        await self.__idle.wait()
+
+ffpool = FFPool(Var.FF_SLOTS)
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+from bot import bot, Var
+from .database import db
+from .tglimiter import tglimit
+
+MEDIA_TYPES = ('document', 'video', 'photo', 'audio', 'animation')
+
+def file_ref(msg):
+    """
+    Everything needed to re-send a FILE_STORE message without fetching it.
+    """
+    for media in MEDIA_TYPES:
+        if obj := getattr(msg, media, None):
+            return {
+                'media': media,
+                'file_id': obj.file_id,
+                'size': getattr(obj, 'file_size', 0) or 0,
+                'caption': msg.caption.html if msg.caption else "",
+            }
+
+class FileCache:
+    """
+    Bounded LRU of FILE_STORE msg_id -> file reference. Filled at upload time
+    and persisted with the anime record, so a delivery is a single
+    send_cached_media call instead of get_messages plus a send.
+    """
+    def __init__(self, size):
+        self.__lru = OrderedDict()
+        self.__size = size
+
+    def put(self, msg_id, ref):
+        if ref:
+            self.__lru[msg_id] = ref
+            self.__lru.move_to_end(msg_id)
+            while len(self.__lru) > self.__size:
+                self.__lru.popitem(last=False)
+        return ref
+
+    def put_message(self, msg):
+        return self.put(msg.id, file_ref(msg))
+
+    async def get(self, msg_id, ani_id=None):
+        if (ref := self.__lru.get(msg_id)) is not None:
+            self.__lru.move_to_end(msg_id)
+            return ref
+        if ani_id is not None and (ref := await db.getFileRef(ani_id, msg_id)):
+            return self.put(msg_id, ref)
+        msg = await bot.get_messages(Var.FILE_STORE, message_ids=msg_id)
+        if not msg or msg.empty:
+            return None
+        return self.put_message(msg)
+
+    async def send(self, chat_id, ref, caption=False, protect=False):
+        return await tglimit.call(chat_id, bot.send_cached_media,
+            chat_id=chat_id,
+            file_id=ref['file_id'],
+            caption=ref['caption'] if caption else "",
+            protect_content=protect
+        )
+
+filecache = FileCache(Var.FILE_CACHE_SIZE)
@@ -0,0 +1,61 @@
+from time import time
+
+from pyrogram.enums import ChatMemberStatus
+from pyrogram.errors import UserNotParticipant
+
+from bot import bot, Var
+
+LEFT = (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED)
+
+class FSubCache:
+    """
+    Force-subscribe lookups kept in memory: confirmed memberships for a short
+    TTL (dropped early on chat member updates), chat titles, one reusable
+    invite link per chat and the bot's own username.
+    """
+    def __init__(self, ttl):
+        self.__ttl = ttl
+        self.__members = {}
+        self.__titles = {}
+        self.__invites = {}
+        self.__username = None
+
+    async def is_member(self, chat_id, uid):
+        if (ts := self.__members.get((chat_id, uid))) and time() - ts < self.__ttl:
+            return True
+        try:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=uid)
+        except UserNotParticipant:
+            self.__members.pop((chat_id, uid), None)
+            return False
+        if member.status in LEFT:
+            self.__members.pop((chat_id, uid), None)
+            return False
+        self.__members[(chat_id, uid)] = time()
+        return True
+
+    def update(self, chat_id, uid, status=None):
+        if status is None or status in LEFT:
+            self.__members.pop((chat_id, uid), None)
+        else:
+            self.__members[(chat_id, uid)] = time()
+
+    async def title(self, chat_id):
+        if (title := self.__titles.get(chat_id)) is None:
+            chat = await bot.get_chat(chat_id)
+            title = self.__titles[chat_id] = chat.title
+            if chat.invite_link:
+                self.__invites.setdefault(chat_id, chat.invite_link)
+        return title
+
+    async def invite(self, chat_id):
+        if (link := self.__invites.get(chat_id)) is None:
+            link = self.__invites[chat_id] = (await bot.create_chat_invite_link(chat_id=chat_id)).invite_link
+        return link
+
+    async def username(self):
+        if self.__username is None:
+            self.__username = (await bot.get_me()).username
+        return self.__username
+
+fsubs = FSubCache(Var.FSUB_TTL)
@@ -1,28 +1,31 @@
-from multiprocessing import cpu_count
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Lock
 from functools import partial, wraps
 from json import loads as jloads
 from re import findall
 from math import floor
-from os import path as ospath
-from time import time, sleep
+from os import path as ospath, makedirs
+from tempfile import mkdtemp
+from time import time
 from traceback import format_exc
 from asyncio import sleep as asleep, create_subprocess_shell
 from asyncio.subprocess import PIPE
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 import base64
 
-from aiohttp import ClientSession
 from aiofiles import open as aiopen
 from aioshutil import rmtree as aiormtree
 from html_telegraph_poster import TelegraphPoster
 from feedparser import parse as feedparse
 from pyrogram.enums import ChatMemberStatus
 from pyrogram.types import InlineKeyboardButton
-from pyrogram.errors import MessageNotModified, FloodWait, UserNotParticipant, ReplyMarkupInvalid, MessageIdInvalid
+from pyrogram.errors import MessageNotModified, ReplyMarkupInvalid, MessageIdInvalid
 
 from bot import bot, bot_loop, LOGS, Var
 from .reporter import rep
+from .http_utils import http
+from .tglimiter import tglimit
+from .fsub_cache import fsubs
 
 def handle_logs(func):
     @wraps(func)
@@ -33,11 +36,98 @@ def handle_logs(func):
             await rep.report(format_exc(), "error")
     return wrapper
     
-async def sync_to_async(func, *args, wait=True, **kwargs):
-    pfunc = partial(func, *args, **kwargs)
-    future = bot_loop.run_in_executor(ThreadPoolExecutor(max_workers=cpu_count() * 125), pfunc)
+class BotExecutor:
+    """
+    The one thread pool behind sync_to_async, plus an optional process pool
+    for CPU-bound work. Tracks how long jobs queue before a worker picks them up.
+    """
+    def __init__(self, threads, procs=0):
+        self.__threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="sync_to_async")
+        self.__procs = ProcessPoolExecutor(max_workers=procs) if procs else None
+        self.__lock = Lock()
+        self.workers = threads
+        self.queued = 0
+        self.active = 0
+        self.proc_pending = 0
+        self.done = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __call(self, pfunc, submitted):
+        waited = time() - submitted
+        with self.__lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        try:
+            return pfunc()
+        finally:
+            with self.__lock:
+                self.active -= 1
+                self.done += 1
+
+    def __proc_done(self, _):
+        self.proc_pending -= 1
+
+    def submit(self, pfunc, cpu=False):
+        if cpu and self.__procs is not None:
+            self.proc_pending += 1
+            future = bot_loop.run_in_executor(self.__procs, pfunc)
+            future.add_done_callback(self.__proc_done)
+            return future
+        with self.__lock:
+            self.queued += 1
+        return bot_loop.run_in_executor(self.__threads, self.__call, pfunc, time())
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'workers': self.workers,
+                'active': self.active,
+                'queued': self.queued,
+                'proc_pending': self.proc_pending,
+                'avg_wait': self.wait_total / self.done if self.done else 0.0,
+                'max_wait': self.wait_max,
+            }
+
+    def shutdown(self):
+        self.__threads.shutdown(wait=False, cancel_futures=True)
+        if self.__procs is not None:
+            self.__procs.shutdown(wait=False, cancel_futures=True)
+
+executor = BotExecutor(Var.THREAD_WORKERS, Var.PROC_WORKERS)
+
+async def sync_to_async(func, *args, wait=True, cpu=False, **kwargs):
+    future = executor.submit(partial(func, *args, **kwargs), cpu)
     return await future if wait else future
     
+class JobSpace:
+    """
+    A private directory under `root` for one job's input link, outputs and
+    temp files. Created atomically with mkdtemp and always removed on exit.
+    """
+    def __init__(self, root="encode", prefix="job_"):
+        self.__root = root
+        self.__prefix = prefix
+        self.path = None
+
+    def join(self, *parts):
+        return ospath.join(self.path, *parts)
+
+    async def __aenter__(self):
+        makedirs(self.__root, exist_ok=True)
+        self.path = mkdtemp(prefix=self.__prefix, dir=self.__root)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.path:
+            try:
+                await aiormtree(self.path, ignore_errors=True)
+            except Exception as e:
+                LOGS.error(f"JobSpace Cleanup Failed for {self.path}: {e}")
+            self.path = None
+
 def new_task(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -56,9 +146,8 @@ async def getfeed(link, index=0):
 
 @handle_logs
 async def aio_urldownload(link):
-    async with ClientSession() as sess:
-        async with sess.get(link) as data:
-            image = await data.read()
+    async with http.session.get(link) as data:
+        image = await data.read()
     path = f"thumbs/{link.split('/')[-1]}"
     if not path.endswith((".jpg" or ".png")):
         path += ".jpg"
@@ -85,15 +174,11 @@ async def get_telegraph(out):
 async def sendMessage(chat, text, buttons=None, get_error=False, **kwargs):
     try:
         if isinstance(chat, int):
-            return await bot.send_message(chat_id=chat, text=text, disable_web_page_preview=True,
+            return await tglimit.call(chat, bot.send_message, chat_id=chat, text=text, disable_web_page_preview=True,
                                         disable_notification=False, reply_markup=buttons, **kwargs)
         else:
-            return await chat.reply(text=text, quote=True, disable_web_page_preview=True, disable_notification=False,
+            return await tglimit.call(chat.chat.id, chat.reply, text=text, quote=True, disable_web_page_preview=True, disable_notification=False,
                                     reply_markup=buttons, **kwargs)
-    except FloodWait as f:
-        await rep.report(f, "warning")
-        sleep(f.value * 1.2)
-        return await sendMessage(chat, text, buttons, get_error, **kwargs)
     except ReplyMarkupInvalid:
         return await sendMessage(chat, text, None, get_error, **kwargs)
     except Exception as e:
@@ -106,12 +191,8 @@ async def editMessage(msg, text, buttons=None, get_error=False, **kwargs):
     try:
         if not msg:
             return None
-        return await msg.edit_text(text=text, disable_web_page_preview=True, 
+        return await tglimit.call(msg.chat.id, msg.edit_text, text=text, disable_web_page_preview=True, 
                                         reply_markup=buttons, **kwargs)
-    except FloodWait as f:
-        await rep.report(f, "warning")
-        sleep(f.value * 1.2)
-        return await editMessage(msg, text, buttons, get_error, **kwargs)
     except ReplyMarkupInvalid:
         return await editMessage(msg, text, None, get_error, **kwargs)
     except (MessageNotModified, MessageIdInvalid):
@@ -133,9 +214,8 @@ async def is_fsubbed(uid):
         return True
     for chat_id in Var.FSUB_CHATS:
         try:
-            member = await bot.get_chat_member(chat_id=chat_id, user_id=uid)
-        except UserNotParticipant:
-            return False
+            if not await fsubs.is_member(chat_id, uid):
+                return False
         except Exception as err:
             await rep.report(format_exc(), "warning")
             continue
@@ -146,19 +226,18 @@ async def get_fsubs(uid, txtargs):
     btns = []
     for no, chat in enumerate(Var.FSUB_CHATS, start=1):
         try:
-            cha = await bot.get_chat(chat)
-            member = await bot.get_chat_member(chat_id=chat, user_id=uid)
-            sta = "Joined ✅️"
-        except UserNotParticipant:
-            sta = "Not Joined ❌️"
-            inv = await bot.create_chat_invite_link(chat_id=chat)
-            btns.append([InlineKeyboardButton(cha.title, url=inv.invite_link)])
+            title = await fsubs.title(chat)
+            if await fsubs.is_member(chat, uid):
+                sta = "Joined ✅️"
+            else:
+                sta = "Not Joined ❌️"
+                btns.append([InlineKeyboardButton(title, url=await fsubs.invite(chat))])
         except Exception as err:
             await rep.report(format_exc(), "warning")
             continue
-        txt += f"<b>{no}. Title :</b> <i>{cha.title}</i>\n  <b>Status :</b> <i>{sta}</i>\n\n"
+        txt += f"<b>{no}. Title :</b> <i>{title}</i>\n  <b>Status :</b> <i>{sta}</i>\n\n"
     if len(txtargs) > 1:
-        btns.append([InlineKeyboardButton('🗂 Get Files', url=f'https://t.me/{(await bot.get_me()).username}?start={txtargs[1]}')])
+        btns.append([InlineKeyboardButton('🗂 Get Files', url=f'https://t.me/{await fsubs.username()}?start={txtargs[1]}')])
     return txt, btns
 
 async def mediainfo(file, get_json=False, get_duration=False):
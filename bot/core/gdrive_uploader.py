@@ -1,53 +1,195 @@
 import os
 import json
-from pydrive2.drive import GoogleDrive
-from pydrive2.auth import GoogleAuth
-from oauth2client.service_account import ServiceAccountCredentials
-from bot.core.reporter import rep
+from hashlib import md5
+from datetime import datetime, timedelta
+from asyncio import Semaphore, TimeoutError as AsyncTimeoutError, sleep as asleep
 from traceback import format_exc
 
-def gdrive_auth():
-    try:
-        # Get JSON from Heroku config
-        sa_json = os.environ.get("SERVICE_ACCOUNT_JSON")
-        if not sa_json:
-            raise Exception("❌ SERVICE_ACCOUNT_JSON not set in Heroku Config Vars")
-
-        sa_info = json.loads(sa_json)
-        scopes = ['https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(sa_info, scopes)
-        
-        gauth = GoogleAuth()
-        gauth.credentials = creds
-        drive = GoogleDrive(gauth)
-        return drive
+from aiohttp import ClientError, ClientTimeout
+from aiofiles import open as aiopen
+from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import Request
 
-    except Exception as e:
-        raise Exception(f"❌ GDrive Auth Failed: {str(e)}")
+from bot import Var
+from bot.core.reporter import rep
+from bot.core.func_utils import sync_to_async
+from bot.core.http_utils import http
 
+SCOPES = ['https://www.googleapis.com/auth/drive']
+CHUNK = 256 * 1024  # Drive wants chunks in multiples of 256 KiB
+RETRYABLE = (429, 500, 502, 503, 504)
 
-async def upload_file(file_path, filename, folder_id=None):
-    try:
-        drive = gdrive_auth()
+class DriveRetry(Exception):
+    pass
+
+class DriveAuth:
+    """
+    Service account credentials parsed once and refreshed shortly before
+    they expire. DRIVE_TOKEN overrides them, e.g. for a local fake Drive.
+    """
+    def __init__(self):
+        self.__creds = None
 
+    async def token(self):
+        if Var.DRIVE_TOKEN:
+            return Var.DRIVE_TOKEN
+        if self.__creds is None:
+            sa_json = os.environ.get("SERVICE_ACCOUNT_JSON")
+            if not sa_json:
+                raise Exception("❌ SERVICE_ACCOUNT_JSON not set in Heroku Config Vars")
+            try:
+                self.__creds = Credentials.from_service_account_info(json.loads(sa_json), scopes=SCOPES)
+            except Exception as e:
+                raise Exception(f"❌ GDrive Auth Failed: {str(e)}")
+        if not self.__creds.valid or self.__creds.expiry - timedelta(minutes=5) <= datetime.utcnow():
+            await sync_to_async(self.__creds.refresh, Request())
+        return self.__creds.token
+
+    async def headers(self, **extra):
+        return {'Authorization': f"Bearer {await self.token()}", **extra}
+
+class DriveUploader:
+    """
+    Resumable, chunked uploads to the Drive v3 API. A transient failure asks
+    the session how much it has and resumes from there; a file already in
+    the folder with the same name and md5 is not uploaded again.
+    """
+    def __init__(self, auth):
+        self.__auth = auth
+        self.__sem = Semaphore(Var.DRIVE_WORKERS)
+        self.__timeout = ClientTimeout(total=None, connect=30, sock_read=300)
+
+    @property
+    def api(self):
+        return Var.DRIVE_API_URL.rstrip('/')
+
+    async def find(self, filename, folder_id, checksum):
+        name = filename.replace("\\", "\\\\").replace("'", "\\'")
+        params = {
+            'q': f"'{folder_id}' in parents and name = '{name}' and trashed = false",
+            'fields': 'files(id,md5Checksum)',
+            'supportsAllDrives': 'true',
+            'includeItemsFromAllDrives': 'true',
+        }
+        async with http.session.get(f"{self.api}/drive/v3/files", params=params, headers=await self.__auth.headers()) as resp:
+            if resp.status != 200:
+                return None
+            files = (await resp.json()).get('files', [])
+        return next((f['id'] for f in files if f.get('md5Checksum') == checksum), None)
+
+    async def __start(self, filename, folder_id, size):
+        headers = await self.__auth.headers(**{
+            'X-Upload-Content-Type': 'video/x-matroska' if filename.endswith('.mkv') else 'application/octet-stream',
+            'X-Upload-Content-Length': str(size),
+        })
+        async with http.session.post(f"{self.api}/upload/drive/v3/files",
+                                     params={'uploadType': 'resumable', 'supportsAllDrives': 'true'},
+                                     json={'name': filename, 'parents': [folder_id]}, headers=headers) as resp:
+            if resp.status != 200:
+                raise Exception(f"Drive Upload Session Failed: {resp.status} {await resp.text()}")
+            return resp.headers['Location']
+
+    @staticmethod
+    def __offset(resp):
+        # 308 Range is inclusive, e.g. "bytes=0-1048575"
+        if rng := resp.headers.get('Range'):
+            return int(rng.rsplit('-', 1)[-1]) + 1
+        return 0
+
+    async def __status(self, session_url, size):
+        headers = await self.__auth.headers(**{'Content-Range': f"bytes */{size}"})
+        async with http.session.put(session_url, headers=headers, timeout=self.__timeout) as resp:
+            if resp.status in (200, 201):
+                return size, await resp.json()
+            if resp.status == 308:
+                return self.__offset(resp), None
+            if resp.status in (404, 410):
+                return None, None
+            if resp.status in RETRYABLE:
+                raise DriveRetry(f"Drive Upload Status Returned {resp.status}")
+            raise Exception(f"Drive Upload Status Failed: {resp.status}")
+
+    async def __send(self, session_url, file_path, size, progress=None):
+        offset, failures = 0, 0
+        chunk_size = max(CHUNK, Var.DRIVE_CHUNK // CHUNK * CHUNK)
+        async with aiopen(file_path, 'rb') as f:
+            while True:
+                try:
+                    await f.seek(offset)
+                    data = await f.read(chunk_size)
+                    crange = f"bytes {offset}-{offset + len(data) - 1}/{size}" if data else f"bytes */{size}"
+                    headers = await self.__auth.headers(**{'Content-Range': crange})
+                    async with http.session.put(session_url, data=data, headers=headers, timeout=self.__timeout) as resp:
+                        if resp.status in (200, 201):
+                            if progress:
+                                await progress(size, size)
+                            return await resp.json()
+                        if resp.status == 308:
+                            offset, failures = self.__offset(resp), 0
+                            if progress:
+                                await progress(offset, size)
+                            continue
+                        if resp.status in (404, 410):
+                            return None
+                        if resp.status not in RETRYABLE:
+                            raise Exception(f"Drive Upload Failed: {resp.status} {await resp.text()}")
+                except (ClientError, AsyncTimeoutError):
+                    pass
+
+                # Back off and ask the session how much it has, a failed probe backs off again
+                while True:
+                    failures += 1
+                    if failures > Var.DRIVE_RETRIES:
+                        raise Exception(f"Drive Upload Failed after {Var.DRIVE_RETRIES} Retries")
+                    await asleep(min(2 ** failures, 64))
+                    try:
+                        status, done = await self.__status(session_url, size)
+                        break
+                    except (ClientError, AsyncTimeoutError, DriveRetry):
+                        pass
+                if done or status is None:
+                    return done
+                offset = status
+
+    async def upload(self, file_path, filename, folder_id, progress=None):
+        async with self.__sem:
+            size = os.path.getsize(file_path)
+            checksum = await sync_to_async(file_md5, file_path)
+            if file_id := await self.find(filename, folder_id, checksum):
+                await rep.report(f"Drive Already has {filename}, Skipped Upload", "info")
+                return file_id
+            # An expired session (404/410) is restarted once from scratch
+            for _ in range(2):
+                session_url = await self.__start(filename, folder_id, size)
+                if done := await self.__send(session_url, file_path, size, progress):
+                    return done['id']
+            raise Exception("Drive Upload Session Expired Twice")
+
+def file_md5(file_path):
+    digest = md5()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+drive = DriveUploader(DriveAuth())
+
+
+async def upload_file(file_path, filename, folder_id=None, progress=None):
+    try:
         if not folder_id:
-            folder_id = os.environ.get("DRIVE_FOLDER_ID")
+            folder_id = Var.DRIVE_FOLDER_ID or os.environ.get("DRIVE_FOLDER_ID")
         if not folder_id:
             raise Exception("❌ DRIVE_FOLDER_ID not set in Heroku Config Vars")
 
-        file = drive.CreateFile({
-            "title": filename,
-            "parents": [{"id": folder_id}]
-        })
-        file.SetContentFile(file_path)
-        file.Upload()
-        return f"https://drive.google.com/uc?id={file['id']}"
+        file_id = await drive.upload(file_path, filename, folder_id, progress)
+        return f"https://drive.google.com/uc?id={file_id}"
 
     except Exception as e:
         await rep.report(format_exc(), "error")
         raise e
 
 
-async def upload_to_drive(file_path, folder_id=None):
+async def upload_to_drive(file_path, folder_id=None, progress=None):
     filename = os.path.basename(file_path)
-    return await upload_file(file_path, filename, folder_id)
+    return await upload_file(file_path, filename, folder_id, progress)
@@ -0,0 +1,33 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from bot import Var, LOGS
+
+class HTTPClient:
+    """
+    One keep-alive aiohttp session for everything in bot/core, created on
+    first use inside the running loop and closed when the bot stops.
+    """
+    def __init__(self):
+        self.__session = None
+
+    @property
+    def session(self):
+        if self.__session is None or self.__session.closed:
+            self.__session = ClientSession(
+                connector=TCPConnector(
+                    limit=Var.HTTP_LIMIT,
+                    limit_per_host=Var.HTTP_PER_HOST,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60,
+                ),
+                timeout=ClientTimeout(total=Var.HTTP_TIMEOUT, connect=15),
+            )
+            LOGS.info("HTTP Client Session Started !")
+        return self.__session
+
+    async def close(self):
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
+        self.__session = None
+
+http = HTTPClient()
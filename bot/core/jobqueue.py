@@ -0,0 +1,55 @@
+from time import time
+from os import path as ospath
+from asyncio import CancelledError, sleep as asleep
+
+from bot import Var
+from .database import db
+from .ffencoder import ffargs
+from .progress import hub
+
+class JobQueue:
+    """
+    Bot side of remote encoding: a job is queued in Mongo, claimed by one of
+    the `python -m bot.worker` processes under a lease, and its outputs are
+    picked up from JOB_SHARE once the worker marks it done.
+    """
+    async def submit(self, name, dl, torrent, filenames):
+        return await db.pushJob({
+            'status': 'queued',
+            'created': time(),
+            'attempts': 0,
+            'name': name,
+            'quals': list(filenames),
+            'names': list(filenames.values()),
+            # Workers encode with the bot's templates, so outputs match the encode cache's profile keys
+            'profiles': {qual: ffargs[qual] for qual in filenames},
+            # Workers on this host (or sharing the path) reuse the download, others fetch the torrent
+            'source': ospath.abspath(dl) if dl else None,
+            'torrent': torrent,
+        })
+
+    async def wait(self, job_id, message=None):
+        while True:
+            job = await db.getJob(job_id)
+            if job.get('status') == 'done':
+                hub.finish(message)
+                return job.get('result') or {}
+            if job.get('status') in (None, 'failed', 'cancelled'):
+                hub.finish(message)
+                return None
+            if prog := job.get('progress'):
+                hub.update(message, f"""<blockquote>‣ <b>Anime Name :</b> <b><i>{job['name']}</i></b></blockquote>
+<blockquote>‣ <b>Status :</b> <i>Encoding on {job.get('worker')}</i>
+    ‣ <b>Rendition :</b> {prog.get('qual')}p
+    ‣ <b>Done :</b> {prog.get('percent', 0)}%</blockquote>""")
+            await asleep(Var.JOB_POLL)
+
+    async def run(self, message, name, dl, torrent, filenames):
+        job_id = await self.submit(name, dl, torrent, filenames)
+        try:
+            return await self.wait(job_id, message)
+        except CancelledError:
+            await db.cancelJob(job_id)
+            raise
+
+jobq = JobQueue()
@@ -0,0 +1,102 @@
+from time import time
+from datetime import datetime
+from os import path as ospath
+
+from bot import Var, bot_loop, LOGS
+from .database import db
+from .anime_index import aniidx
+
+STAGES = ('resolved', 'downloaded', 'encoded', 'uploaded', 'posted')
+
+class PipelineJob:
+    """
+    One episode's way through the auto pipeline, written to Mongo as each
+    stage completes: resolved -> downloaded -> encoded[qual] ->
+    uploaded[qual] -> posted. A restarted bot picks up from the last one.
+    """
+    def __init__(self, doc):
+        self.doc = doc
+
+    @property
+    def id(self):
+        return self.doc['_id']
+
+    def get(self, key, default=None):
+        return self.doc.get(key, default)
+
+    async def __save(self, stage=None, **fields):
+        if stage:
+            fields['stage'] = stage
+        fields['ts'] = time()
+        await db.saveJobState(self.id, fields)
+        for key, value in fields.items():
+            if '.' in key:
+                top, sub = key.split('.', 1)
+                self.doc.setdefault(top, {})[sub] = value
+            else:
+                self.doc[key] = value
+
+    def download(self):
+        if (dl := self.get('dl')) and ospath.exists(dl):
+            return dl
+
+    def ready(self, qual):
+        """
+        What a resumed job already has for `qual`: the uploaded message as a
+        {msg_id, ref} dict, the encoded file path, or None.
+        """
+        if up := self.get('uploaded', {}).get(qual):
+            return up
+        if (path := self.get('encoded', {}).get(qual)) and ospath.exists(path):
+            return path
+
+    async def posted_msg(self, post_id):
+        await self.__save(post_id=post_id)
+
+    async def downloaded(self, dl):
+        await self.__save('downloaded', dl=dl)
+
+    async def encoded(self, qual, path):
+        await self.__save('encoded', **{f"encoded.{qual}": path})
+
+    async def uploaded(self, qual, msg_id, ref):
+        await self.__save('uploaded', **{f"uploaded.{qual}": {'msg_id': msg_id, 'ref': ref}})
+
+    async def posted(self):
+        await self.__save('posted', done_at=datetime.utcnow())
+
+    async def failed(self, error):
+        await self.__save('failed', error=error, done_at=datetime.utcnow())
+
+class Pipeline:
+    async def open(self, ani_id, ep, name, torrent, force=False):
+        key = f"{ani_id}:{ep}"
+        doc = await db.getJobState(key)
+        if doc and doc.get('stage') not in ('posted', 'failed'):
+            doc['attempts'] = doc.get('attempts', 0) + 1
+            await db.saveJobState(key, {'attempts': doc['attempts']})
+            LOGS.info(f"Resuming {name} from Stage {doc.get('stage')} (Attempt {doc['attempts']})")
+            return PipelineJob(doc)
+        doc = {'_id': key, 'ani_id': ani_id, 'ep': ep, 'name': name, 'torrent': torrent, 'force': force,
+               'stage': 'resolved', 'encoded': {}, 'uploaded': {}, 'attempts': 1, 'created': time()}
+        await db.newJobState(doc)
+        return PipelineJob(doc)
+
+    async def resume(self, runner):
+        """
+        Restart every unfinished job through `runner(name, torrent, force)`,
+        closing ones the anime index already has as done and giving up on
+        one that already failed JOB_RETRIES times.
+        """
+        async for doc in db.getOpenJobStates():
+            if not doc.get('force') and aniidx.is_done(doc.get('ani_id'), doc.get('ep')):
+                # Finished elsewhere (or posted right before the crash), the runner would just return
+                await PipelineJob(doc).posted()
+                continue
+            if doc.get('attempts', 0) >= Var.JOB_RETRIES:
+                await PipelineJob(doc).failed("Too Many Attempts")
+                LOGS.warning(f"Dropped {doc['name']} after {doc['attempts']} Attempts")
+                continue
+            bot_loop.create_task(runner(doc['name'], doc['torrent'], doc.get('force', False)))
+
+pipeline = Pipeline()
@@ -0,0 +1,109 @@
+from time import time
+from datetime import timedelta
+from asyncio import sleep as asleep
+
+import psutil
+
+from bot import Var, bot_loop, LOGS
+from .func_utils import editMessage, sendMessage
+
+class SysStats:
+    """
+    One psutil sample shared by every status render, refreshed at most
+    every `ttl` seconds.
+    """
+    def __init__(self, ttl):
+        self.__ttl = ttl
+        self.__sampled = 0
+        self.__text = ""
+
+    def text(self):
+        if time() - self.__sampled >= self.__ttl:
+            self.__sampled = time()
+            uptime = str(timedelta(seconds=int(time() - psutil.boot_time())))
+            self.__text = f"CPU: {psutil.cpu_percent(interval=None)}% | RAM: {psutil.virtual_memory().percent}% | FREE: {psutil.disk_usage('/').free / (1024**3):.2f}GB | UPTIME: {uptime}"
+        return self.__text
+
+class ProgressHub:
+    """
+    Jobs push their latest status text here instead of editing messages
+    themselves. Renders are paced by how many jobs share a chat, unchanged
+    text is never re-sent, and with PROGRESS_DASHBOARD every active job in a
+    chat is collapsed into one message.
+    """
+    def __init__(self):
+        self.__jobs = {}
+        self.__boards = {}
+        self.__task = None
+
+    def update(self, message, text):
+        if not message or isinstance(message, str):
+            return
+        key = (message.chat.id, message.id)
+        if (job := self.__jobs.get(key)) is None:
+            job = self.__jobs[key] = {'message': message, 'sent': None, 'last': 0, 'busy': False}
+        job['text'] = text
+        if self.__task is None or self.__task.done():
+            self.__task = bot_loop.create_task(self.__run())
+
+    def finish(self, message):
+        if message and not isinstance(message, str):
+            self.__jobs.pop((message.chat.id, message.id), None)
+
+    def __interval(self, chat_id, count):
+        # Progress gets about half of the chat's edit budget
+        if chat_id < 0:
+            return max(Var.PROGRESS_INTERVAL, count * 120 / Var.TG_GROUP_RATE)
+        return max(Var.PROGRESS_INTERVAL, count * 2 / Var.TG_CHAT_RATE)
+
+    async def __edit(self, job, text):
+        try:
+            await editMessage(job['message'], text)
+        finally:
+            job['busy'] = False
+
+    async def __board(self, chat_id, board, text):
+        try:
+            if board['message'] is None:
+                board['message'] = await sendMessage(chat_id, text)
+            else:
+                await editMessage(board['message'], text)
+        finally:
+            board['busy'] = False
+
+    def __render(self, now):
+        chats = {}
+        for job in self.__jobs.values():
+            chats.setdefault(job['message'].chat.id, []).append(job)
+
+        for chat_id, jobs in chats.items():
+            if Var.PROGRESS_DASHBOARD:
+                board = self.__boards.setdefault(chat_id, {'message': None, 'sent': None, 'last': 0, 'busy': False})
+                text = "\n\n".join(job['text'] for job in jobs)[:4096]
+                if board['busy'] or text == board['sent'] or now - board['last'] < self.__interval(chat_id, 1):
+                    continue
+                board.update(sent=text, last=now, busy=True)
+                bot_loop.create_task(self.__board(chat_id, board, text))
+                continue
+
+            interval = self.__interval(chat_id, len(jobs))
+            for job in jobs:
+                if job['busy'] or job['text'] == job['sent'] or now - job['last'] < interval:
+                    continue
+                job.update(sent=job['text'], last=now, busy=True)
+                bot_loop.create_task(self.__edit(job, job['text']))
+
+        for chat_id in [cid for cid in self.__boards if cid not in chats]:
+            if (board := self.__boards.pop(chat_id))['message'] and not isinstance(board['message'], str):
+                bot_loop.create_task(board['message'].delete())
+
+    async def __run(self):
+        while self.__jobs or self.__boards:
+            try:
+                self.__render(time())
+            except Exception as e:
+                LOGS.error(f"Progress Render Failed: {e}")
+            await asleep(1)
+
+sysstats = SysStats(Var.STATS_TTL)
+hub = ProgressHub()
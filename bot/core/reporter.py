@@ -1,12 +1,14 @@
-from time import sleep
-from pyrogram.errors import FloodWait
-from bot import Var, LOGS, bot
+from asyncio import gather
+
+from bot import Var, LOGS, bot, bot_loop
+from .tglimiter import tglimit
 
 class Reporter:
     def __init__(self, client, chat_id, log):
         self.__client = client
         self.__cid = chat_id
         self.__logger = log
+        self.__pending = set()
 
     async def report(self, msg, log_type, log=True):
         txt = [f"[{log_type.upper()}] {msg}", log_type.lower()]
@@ -19,12 +21,20 @@ class Reporter:
         else:
             self.__logger.info(txt[0])
         if log and self.__cid != 0:
-            try:
-                await self.__client.send_message(self.__cid, f"{txt[0][:4096]}")
-            except FloodWait as f:
-                self.__logger.warning(str(f))
-                sleep(f.value * 1.5)
-            except Exception as err:
-                self.__logger.error(str(err))
+            # Paced in the background, so a busy log chat never holds up the caller
+            task = bot_loop.create_task(self.__send(txt[0][:4096]))
+            self.__pending.add(task)
+            task.add_done_callback(self.__pending.discard)
+
+    async def drain(self):
+        # Reports still queued behind the limiter are lost if the process execs or exits first
+        if self.__pending:
+            await gather(*self.__pending, return_exceptions=True)
+
+    async def __send(self, text):
+        try:
+            await tglimit.call(self.__cid, self.__client.send_message, self.__cid, text)
+        except Exception as err:
+            self.__logger.error(str(err))
 
 rep = Reporter(bot, Var.LOG_CHANNEL, LOGS)
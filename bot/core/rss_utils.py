@@ -1,7 +1,12 @@
 # bot/core/rss_utils.py
 
+from asyncio import gather
+from aiohttp import ClientTimeout
 import feedparser
-from bot import LOGS
+from bot import Var, LOGS
+from bot.core.database import db
+from bot.core.func_utils import sync_to_async
+from bot.core.http_utils import http
 
 async def getfeed(url: str, retry: int = 1):
     """
@@ -19,3 +24,77 @@ async def getfeed(url: str, retry: int = 1):
         if retry > 0:
             return await getfeed(url, retry=retry-1)
         return None
+
+
+def entry_id(entry):
+    return entry.get('id') or entry.get('link') or entry.get('title')
+
+
+class RSSPoller:
+    """
+    Polls every feed concurrently with conditional GETs and returns each entry
+    not seen before, oldest first. Seen GUIDs and validators are kept in Mongo
+    so nothing is replayed or dropped across restarts.
+    """
+    def __init__(self):
+        self.__state = {}
+
+    async def __load(self, link):
+        if link not in self.__state:
+            doc = await db.getFeedState(link)
+            self.__state[link] = {
+                'guids': list(doc['guids']) if 'guids' in doc else None,
+                'etag': doc.get('etag'),
+                'modified': doc.get('modified'),
+            }
+        return self.__state[link]
+
+    async def __fetch(self, link):
+        try:
+            state = await self.__load(link)
+            headers = {}
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['modified']:
+                headers['If-Modified-Since'] = state['modified']
+
+            async with http.session.get(link, headers=headers, timeout=ClientTimeout(total=30)) as resp:
+                if resp.status == 304:
+                    return []
+                if resp.status != 200:
+                    LOGS.error(f"RSS Feed {link} Returned {resp.status}")
+                    return []
+                content = await resp.read()
+                etag, modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+
+            feed = await sync_to_async(feedparser.parse, content)
+            if feed.bozo:
+                # Feeds with a stray bad character are still parsed, only warn about them
+                LOGS.warning(f"RSS Feed {link} Parsed with Errors: {feed.get('bozo_exception')}")
+            if not feed.entries:
+                # An error page or a broken feed must not wipe what was already seen
+                LOGS.error(f"RSS Feed {link} Returned No Usable Entries, Keeping Previous State")
+                return []
+            guids = [entry_id(entry) for entry in feed.entries]
+            if state['guids'] is None:
+                # First poll of a new feed only picks up the latest release
+                new = feed.entries[:1]
+            else:
+                seen = set(state['guids'])
+                new = [entry for entry, guid in zip(feed.entries, guids) if guid not in seen]
+
+            # Newest first, merged with what was seen before and capped so the state can't grow forever
+            fresh = set(guids)
+            merged = (guids + [guid for guid in state['guids'] or [] if guid not in fresh])[:Var.RSS_SEEN]
+            state.update(guids=merged, etag=etag, modified=modified)
+            await db.saveFeedState(link, merged, etag, modified)
+            return new[::-1]
+        except Exception as e:
+            LOGS.error(f"[ERROR] Failed to poll RSS feed {link}: {e}")
+            return []
+
+    async def poll(self, links):
+        results = await gather(*(self.__fetch(link) for link in links))
+        return [entry for entries in results for entry in entries]
+
+rss = RSSPoller()
@@ -1,13 +1,17 @@
 from calendar import month_name
+from collections import OrderedDict
 from datetime import datetime
 from random import choice
+from re import sub as re_sub
+from time import time
 from asyncio import sleep as asleep
-from aiohttp import ClientSession
 from anitopy import parse
 
-from bot import Var, bot
+from bot import Var, bot, bot_loop, LOGS
+from bot.core.database import db
 from .ffencoder import ffargs
 from .func_utils import handle_logs
+from .http_utils import http
 from .reporter import rep
 
 CAPTION_FORMAT = """
@@ -108,6 +112,70 @@ query ($id: Int, $search: String, $seasonYear: Int) {
 }
 """
 
+# Slim selection for list views like the daily schedule
+ANIME_LIST_FIELDS = """
+    id
+    title {
+      romaji
+      english
+      native
+    }
+    format
+    status(version: 2)
+    episodes
+    coverImage {
+      large
+    }
+    nextAiringEpisode {
+      airingAt
+      episode
+    }
+    siteUrl
+"""
+
+def batch_query(count, fields=ANIME_LIST_FIELDS):
+    params = ", ".join(f"$s{no}: String" for no in range(count))
+    medias = "\n".join(f"  a{no}: Media(search: $s{no}, type: ANIME, format_not_in: [MOVIE, MUSIC, MANGA, NOVEL, ONE_SHOT]) {{{fields}  }}" for no in range(count))
+    return f"query ({params}) {{\n{medias}\n}}"
+
+async def batch_anidata(names, fields=ANIME_LIST_FIELDS):
+    """
+    Resolve many anime names with one aliased GraphQL request per
+    ANILIST_BATCH names. Returns one dict per name, {} where nothing matched.
+    Names already in the metadata cache are served from it.
+    """
+    results = [{} for _ in names]
+    pending = []
+    for no, name in enumerate(names):
+        if name and (cached := anicache.peek(ani_key(name))):
+            results[no] = cached
+        elif name:
+            pending.append(no)
+
+    for start in range(0, len(pending), Var.ANILIST_BATCH):
+        chunk = pending[start:start + Var.ANILIST_BATCH]
+        payload = {
+            'query': batch_query(len(chunk), fields),
+            'variables': {f"s{no}": names[idx] for no, idx in enumerate(chunk)}
+        }
+        for _ in range(3):
+            async with http.session.post("https://graphql.anilist.co", json=payload) as resp:
+                res_code, resp_json, res_heads = resp.status, await resp.json(content_type=None), resp.headers
+            if res_code == 429:
+                f_timer = int(res_heads.get('Retry-After', 60))
+                await rep.report(f"AniList API FloodWait: {res_code}, Sleeping for {f_timer} !!", "error")
+                await asleep(f_timer)
+            elif res_code in [500, 501, 502]:
+                await rep.report(f"AniList Server API Error: {res_code}, Waiting 5s to Try Again !!", "error")
+                await asleep(5)
+            else:
+                break
+        # Unmatched aliases come back as null with a 404 while the rest still resolve
+        data = (resp_json or {}).get('data') or {}
+        for no, idx in enumerate(chunk):
+            results[idx] = data.get(f"a{no}") or {}
+    return results
+
 class AniLister:
     def __init__(self, anime_name: str, year: int) -> None:
         self.__api = "https://graphql.anilist.co"
@@ -123,9 +191,8 @@ class AniLister:
             self.__vars = {'search' : self.__ani_name}
     
     async def post_data(self):
-        async with ClientSession() as sess:
-            async with sess.post(self.__api, json={'query': ANIME_GRAPHQL_QUERY, 'variables': self.__vars}) as resp:
-                return (resp.status, await resp.json(), resp.headers)
+        async with http.session.post(self.__api, json={'query': ANIME_GRAPHQL_QUERY, 'variables': self.__vars}) as resp:
+            return (resp.status, await resp.json(), resp.headers)
         
     async def get_anidata(self):
         res_code, resp_json, res_heads = await self.post_data()
@@ -153,6 +220,71 @@ class AniLister:
             await rep.report(f"AniList API Error: {res_code}", "error", log=False)
             return {}
     
+def ani_key(name):
+    return re_sub(r"\s+", " ", re_sub(r"[^\w\s]", " ", name.lower())).strip()
+
+class AniCache:
+    """
+    In-memory LRU in front of the Mongo AniList cache. Entries older than the
+    TTL are still served for the stale window while a refresh runs behind them.
+    """
+    def __init__(self, size, ttl, stale):
+        self.__lru = OrderedDict()
+        self.__size = size
+        self.__ttl = ttl
+        self.__stale = stale
+        self.__refreshing = set()
+
+    def __remember(self, key, entry):
+        self.__lru[key] = entry
+        self.__lru.move_to_end(key)
+        while len(self.__lru) > self.__size:
+            self.__lru.popitem(last=False)
+
+    def __lookup(self, key):
+        if (entry := self.__lru.get(key)) is not None:
+            self.__lru.move_to_end(key)
+        return entry
+
+    async def get(self, key, loader):
+        if not (entry := self.__lookup(key)) and (doc := await db.getAniMeta(key)):
+            entry = (doc['data'], doc['ts'])
+            self.__remember(key, entry)
+        if entry:
+            data, ts = entry
+            age = time() - ts
+            if age < self.__ttl:
+                return data
+            if age < self.__ttl + self.__stale:
+                if key not in self.__refreshing:
+                    self.__refreshing.add(key)
+                    bot_loop.create_task(self.__refresh(key, loader))
+                return data
+        return await self.__refresh(key, loader)
+
+    def peek(self, key):
+        if (entry := self.__lookup(key)) and time() - entry[1] < self.__ttl + self.__stale:
+            return entry[0]
+
+    async def put(self, key, data):
+        if data and data.get('id'):
+            entry = (data, time())
+            self.__remember(key, entry)
+            await db.saveAniMeta(key, data, entry[1])
+
+    async def __refresh(self, key, loader):
+        try:
+            data = await loader()
+            await self.put(key, data)
+            return data
+        except Exception as e:
+            LOGS.error(f"AniList Cache Refresh Failed for {key}: {e}")
+            return (self.__lookup(key) or ({},))[0]
+        finally:
+            self.__refreshing.discard(key)
+
+anicache = AniCache(Var.ANILIST_CACHE_SIZE, Var.ANILIST_TTL, Var.ANILIST_STALE)
+
 class TextEditor:
     def __init__(self, name):
         self.__name = name
@@ -160,15 +292,21 @@ class TextEditor:
         self.pdata = parse(name)
 
     async def load_anilist(self):
+        if not (ani_name := await self.parse_name()):
+            self.adata = await self.fetch_anilist()
+            return
+        self.adata = await anicache.get(ani_key(ani_name), self.fetch_anilist)
+
+    async def fetch_anilist(self):
         cache_names = []
         for option in [(False, False), (False, True), (True, False), (True, True)]:
             ani_name = await self.parse_name(*option)
             if ani_name in cache_names:
                 continue
             cache_names.append(ani_name)
-            self.adata = await AniLister(ani_name, datetime.now().year).get_anidata()
-            if self.adata:
-                break
+            if adata := await AniLister(ani_name, datetime.now().year).get_anidata():
+                return adata
+        return {}
 
     @handle_logs
     async def get_id(self):
@@ -0,0 +1,71 @@
+from time import time
+from collections import OrderedDict
+from asyncio import sleep as asleep
+from pyrogram.errors import FloodWait
+
+from bot import Var, LOGS
+
+class TokenBucket:
+    """
+    Reserving token bucket (GCRA): each acquire books the next free send
+    slot, so concurrent callers queue up in order without a lock.
+    """
+    def __init__(self, rate, burst=1):
+        self.__interval = 1 / rate
+        self.__tolerance = self.__interval * (burst - 1)
+        self.__tat = 0.0
+
+    def reserve(self, now):
+        tat = max(self.__tat, now)
+        self.__tat = tat + self.__interval
+        return max(0.0, tat - self.__tolerance - now)
+
+class TgLimiter:
+    """
+    Paces Bot API calls against Telegram's global and per-chat limits up
+    front, and waits out FloodWait asynchronously so the loop keeps running.
+    """
+    def __init__(self):
+        self.__global = TokenBucket(Var.TG_GLOBAL_RATE, Var.TG_GLOBAL_RATE)
+        self.__chats = OrderedDict()
+        self.__flood_until = {}
+
+    def __bucket(self, chat_id):
+        if (bucket := self.__chats.get(chat_id)) is None:
+            # Groups & channels allow ~20 msgs/min, private chats ~1 msg/s
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(Var.TG_GROUP_RATE / 60, 3)
+            else:
+                bucket = TokenBucket(Var.TG_CHAT_RATE, 3)
+            self.__chats[chat_id] = bucket
+            # Every user who ever opened a link gets a bucket, forget the longest idle ones
+            while len(self.__chats) > Var.TG_CHAT_CACHE:
+                old, _ = self.__chats.popitem(last=False)
+                self.__flood_until.pop(old, None)
+        else:
+            self.__chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id):
+        now = time()
+        wait = max(self.__bucket(chat_id).reserve(now), self.__global.reserve(now))
+        if (until := self.__flood_until.get(chat_id)) is not None:
+            if until > now:
+                wait = max(wait, until - now)
+            else:
+                del self.__flood_until[chat_id]
+        if wait > 0:
+            await asleep(wait)
+
+    async def call(self, chat_id, func, *args, **kwargs):
+        for attempt in range(Var.TG_RETRIES):
+            await self.acquire(chat_id)
+            try:
+                return await func(*args, **kwargs)
+            except FloodWait as f:
+                LOGS.warning(f"FloodWait of {f.value}s in {chat_id} ({attempt+1}/{Var.TG_RETRIES})")
+                self.__flood_until[chat_id] = max(self.__flood_until.get(chat_id, 0), time() + f.value * 1.2)
+                if attempt + 1 == Var.TG_RETRIES:
+                    raise
+
+tglimit = TgLimiter()
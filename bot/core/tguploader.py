@@ -1,13 +1,13 @@
-from time import time, sleep
+from time import time
 from traceback import format_exc
 from math import floor
 from os import path as ospath
-from pyrogram.errors import FloodWait
 
 from bot import bot, Var
-from .func_utils import editMessage, convertBytes, convertTime
+from .func_utils import convertBytes, convertTime
 from .reporter import rep
-from .gdrive_uploader import upload_to_drive  # ✅ Import Drive uploader
+from .tglimiter import tglimit
+from .progress import hub
 
 
 class TgUploader:
@@ -25,7 +25,7 @@ class TgUploader:
         self.__qual = qual
         try:
             if Var.AS_DOC:
-                msg = await self.__client.send_document(
+                msg = await tglimit.call(Var.FILE_STORE, self.__client.send_document,
                     chat_id=Var.FILE_STORE,
                     document=path,
                     thumb="thumb.jpg" if ospath.exists("thumb.jpg") else None,
@@ -34,7 +34,7 @@ class TgUploader:
                     progress=self.progress_status
                 )
             else:
-                msg = await self.__client.send_video(
+                msg = await tglimit.call(Var.FILE_STORE, self.__client.send_video,
                     chat_id=Var.FILE_STORE,
                     video=path,
                     thumb="thumb.jpg" if ospath.exists("thumb.jpg") else None,
@@ -42,23 +42,12 @@ class TgUploader:
                     progress=self.progress_status
                 )
 
+            hub.finish(self.message)
             await rep.report("[INFO] Succesfully Uploaded File into Tg...", "info")
-
-            # ✅ After Telegram upload → Upload to Drive
-            drive_link = await upload_to_drive(path)
-
-            if drive_link:
-                await self.__client.send_message(
-                    chat_id=Var.LOG_CHANNEL,
-                    text=f"✅ <b>{self.__name}</b> also uploaded to <b>Google Drive</b>\n\n🔗 {drive_link}"
-                )
-
             return msg
 
-        except FloodWait as e:
-            sleep(e.value * 1.5)
-            return await self.upload(path, qual)
         except Exception as e:
+            hub.finish(self.message)
             await rep.report(format_exc(), "error")
             raise e
         # ❌ Removed file deletion here (TokyoTosho still needs it!)
@@ -68,7 +57,7 @@ class TgUploader:
             self.__client.stop_transmission()
         now = time()
         diff = now - self.__start
-        if (now - self.__updater) >= 7 or current == total:
+        if (now - self.__updater) >= 1 or current == total:
             self.__updater = now
             percent = round(current / total * 100, 2)
             speed = current / diff
@@ -85,4 +74,4 @@ class TgUploader:
     ‣ <b>Time Left :</b> {convertTime(eta)}
 
 ‣ <b>File(s) Encoded:</b> <code>{Var.QUALS.index(self.__qual)} / {len(Var.QUALS)}</code>"""
-            await editMessage(self.message, progress_str)
+            hub.update(self.message, progress_str)
@@ -1,9 +1,14 @@
 from os import path as ospath
+from time import time
+from asyncio import sleep as asleep
 from aiofiles import open as aiopen
 from aiofiles.os import path as aiopath, remove as aioremove, mkdir
-from aiohttp import ClientSession
 from torrentp import TorrentDownloader
+import libtorrent as lt
+
+from bot import Var
 from bot.core.func_utils import handle_logs
+from bot.core.http_utils import http
 
 class TorDownloader:
     def __init__(self, path="./downloads"):
@@ -36,11 +41,104 @@ class TorDownloader:
         tor_name = url.split('/')[-1]
         des_dir = ospath.join(self.__torpath, tor_name)
 
-        async with ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    async with aiopen(des_dir, 'wb') as file:
-                        async for chunk in response.content.iter_any():
-                            await file.write(chunk)
-                    return des_dir
+        async with http.session.get(url) as response:
+            if response.status == 200:
+                async with aiopen(des_dir, 'wb') as file:
+                    async for chunk in response.content.iter_any():
+                        await file.write(chunk)
+                return des_dir
         return None
+
+
+tor_ses = None
+
+def tor_session():
+    """
+    The one libtorrent session every streamer adds its torrent to, so they
+    don't fight over the listen port and stopping a stream never blocks on
+    a session teardown.
+    """
+    global tor_ses
+    if tor_ses is None:
+        tor_ses = lt.session({'listen_interfaces': '0.0.0.0:6881,[::]:6881'})
+    return tor_ses
+
+class TorStreamer:
+    """
+    Downloads the main file of a torrent in sequential piece order and
+    streams its bytes as soon as each piece has been verified, so the
+    encoder can start before the download is complete.
+    """
+    def __init__(self, path="./downloads"):
+        self.__downdir = path
+        self.__handle = None
+        self.__info = None
+        self.__index = None
+        self.path = None
+
+    @handle_logs
+    async def start(self, torrent_url):
+        torfile = await TorDownloader(self.__downdir).get_torfile(torrent_url)
+        if not torfile:
+            return None
+        self.__info = lt.torrent_info(torfile)
+        await aioremove(torfile)
+
+        files = self.__info.files()
+        self.__index = max(range(files.num_files()), key=files.file_size)
+        params = lt.add_torrent_params()
+        params.ti = self.__info
+        params.save_path = self.__downdir
+        params.flags |= lt.torrent_flags.sequential_download
+        params.file_priorities = [4 if i == self.__index else 0 for i in range(files.num_files())]
+
+        self.__handle = tor_session().add_torrent(params)
+        self.path = ospath.join(self.__downdir, files.file_path(self.__index))
+        return self.path
+
+    def __prioritise(self, piece, window=8):
+        for no, p in enumerate(range(piece, min(piece + window, self.__info.num_pieces()))):
+            if not self.__handle.have_piece(p):
+                self.__handle.set_piece_deadline(p, no * 1000)
+
+    async def stream(self, chunk_size=1 << 20):
+        files = self.__info.files()
+        fsize, foffset = files.file_size(self.__index), files.file_offset(self.__index)
+        plen = self.__info.piece_length()
+        offset, last_piece, f = 0, -1, None
+        try:
+            while offset < fsize:
+                piece = (foffset + offset) // plen
+                if piece != last_piece:
+                    self.__prioritise(piece)
+                    last_piece = piece
+                stalled = time()
+                while not self.__handle.have_piece(piece):
+                    if time() - stalled > Var.TOR_STALL:
+                        raise TimeoutError(f"Torrent Stalled at Piece {piece} for {Var.TOR_STALL}s")
+                    await asleep(0.5)
+                if f is None:
+                    f = await aiopen(self.path, 'rb')
+                end = min((piece + 1) * plen - foffset, fsize)
+                await f.seek(offset)
+                while offset < end:
+                    if not (chunk := await f.read(min(chunk_size, end - offset))):
+                        raise EOFError(f"Short Read at {offset} of {self.path}")
+                    offset += len(chunk)
+                    yield chunk
+        finally:
+            if f is not None:
+                await f.close()
+
+    async def wait(self):
+        while self.__handle is not None and not self.__handle.status().is_finished:
+            await asleep(1)
+        # Stopped before it finished, whatever is on disk is partial
+        if self.__handle is None:
+            return None
+        return self.path if self.path and ospath.exists(self.path) else None
+
+    async def stop(self):
+        if self.__handle is not None:
+            tor_session().remove_torrent(self.__handle)
+        self.__handle = None
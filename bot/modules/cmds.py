@@ -1,11 +1,16 @@
-from asyncio import sleep as asleep, gather
-from pyrogram.filters import command, private, user
+from asyncio import gather
+from pyrogram.filters import command, private, user, chat
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors import FloodWait, MessageNotModified
 
 from bot import bot, bot_loop, Var, ani_cache
 from bot.core.database import db
-from bot.core.func_utils import decode, is_fsubbed, get_fsubs, editMessage, sendMessage, new_task, convertTime, getfeed
+from bot.core.func_utils import decode, is_fsubbed, get_fsubs, editMessage, sendMessage, new_task, convertTime, getfeed, executor
+from bot.core.ffpool import ffpool
+from bot.core.file_cache import filecache
+from bot.core.autodelete import autodel
+from bot.core.fsub_cache import fsubs
+from bot.core.ffbench import run_bench
 from bot.core.auto_animes import fetch_animes
 from bot.core.reporter import rep
 
@@ -58,23 +63,24 @@ async def start_msg(client, message):
             await editMessage(temp, "<b>Input Link Code is Invalid !</b>")
             return
         try:
-            msg = await client.get_messages(Var.FILE_STORE, message_ids=fid)
-            if msg.empty:
+            if not (ref := await filecache.get(fid)):
                 return await editMessage(temp, "<b>File Not Found !</b>")
-            nmsg = await msg.copy(message.chat.id, reply_markup=None)
+            nmsg = await filecache.send(message.chat.id, ref, caption=True)
             await temp.delete()
             if Var.AUTO_DEL:
-                async def auto_del(msg, timer):
-                    await asleep(timer)
-                    await msg.delete()
                 await sendMessage(message, f'<i>File will be Auto Deleted in {convertTime(Var.DEL_TIMER)}, Forward to Saved Messages Now..</i>')
-                bot_loop.create_task(auto_del(nmsg, Var.DEL_TIMER))
+                await autodel.schedule(message.chat.id, [nmsg.id], Var.DEL_TIMER)
         except Exception as e:
             await rep.report(f"User : {uid} | Error : {str(e)}", "error")
             await editMessage(temp, "<b>File Not Found !</b>")
     else:
         await editMessage(temp, "<b>Input Link is Invalid for Usage !</b>")
     
+@bot.on_chat_member_updated(chat(Var.FSUB_CHATS))
+async def fsub_member_update(client, update):
+    if member := update.new_chat_member or update.old_chat_member:
+        fsubs.update(update.chat.id, member.user.id, update.new_chat_member.status if update.new_chat_member else None)
+
 @bot.on_message(command('pause') & private & user(Var.ADMINS))
 async def pause_fetch(client, message):
     ani_cache['fetch_animes'] = False
@@ -90,6 +96,46 @@ async def pause_fetch(client, message):
 async def _log(client, message):
     await message.reply_document("log.txt", quote=True)
 
+@bot.on_message(command('stats') & private & user(Var.ADMINS))
+@new_task
+async def _stats(client, message):
+    st = executor.stats()
+    await sendMessage(message, f"""<b>Executor Stats</b>
+
+    • <b>Threads :</b> {st['active']} active / {st['workers']} workers
+    • <b>Queued :</b> {st['queued']} jobs waiting for a thread
+    • <b>Process Jobs :</b> {st['proc_pending']} pending
+    • <b>Wait Time :</b> {st['avg_wait']:.3f}s avg, {st['max_wait']:.3f}s max
+
+    • <b>Encode Slots :</b> {ffpool.active} / {ffpool.slots} busy, {ffpool.waiting} waiting""")
+
+@bot.on_message(command('bench') & private & user(Var.ADMINS))
+@new_task
+async def _bench(client, message):
+    # /bench [seconds] [path/to/source.mkv], without a source a synthetic 1080p clip is used
+    args = message.text.split(maxsplit=2)[1:]
+    seconds = int(args.pop(0)) if args and args[0].isdigit() else None
+    source = args[0] if args else None
+    stat = await sendMessage(message, "<i>Benchmarking Encoder Profiles...</i>")
+
+    async def on_step(qual, name):
+        await editMessage(stat, f"<i>Benchmarking Encoder Profiles...</i>\n\n    • <b>Running :</b> <code>{qual}p / {name}</code>")
+
+    try:
+        results, picks, report = await run_bench(Var.QUALS, source, seconds, on_step, f"bench:{message.id}")
+    except Exception as e:
+        await rep.report(f"Bench Failed : {e}", "error")
+        return await editMessage(stat, f"<b>Bench Failed :</b> <code>{e}</code>")
+
+    txt = "<b>Encoder Bench Results</b>\n"
+    for qual, runs in results.items():
+        txt += f"\n<b>{qual}p</b>\n"
+        for name, r in sorted(runs.items(), key=lambda x: -x[1]['fps']):
+            mark = "✅" if picks.get(qual, {}).get('profile') == name else "•"
+            txt += f"  {mark} <code>{name}</code> : {r['fps']} fps | {r['cpu']}% CPU | {r['kbps']} kbps | SSIM {r['ssim']} | PSNR {r['psnr']}\n"
+    await editMessage(stat, txt[:4096])
+    await message.reply_document(report, quote=True)
+
 @bot.on_message(command('addlink') & private & user(Var.ADMINS))
 @new_task
 async def add_task(client, message):
@@ -1,18 +1,15 @@
 import os
 import time
-import asyncio
 from asyncio import Queue, Lock, create_task
 from os import remove, path as ospath
-import aiofiles
-from re import findall
-import psutil
-import datetime
 
 from pyrogram import filters
 from bot import bot, Var, LOGS
 from bot.core.ffencoder import FFEncoder
+from bot.core.ffpool import ffpool
 from bot.core import gdrive_uploader
 from bot.core.func_utils import convertBytes  # ensure exists
+from bot.core.progress import hub, sysstats
 
 # -------------------- Queue & Lock -------------------- #
 ffQueue = Queue()
@@ -34,13 +31,6 @@ async def update_progress(msg, file_name, percent, start_time, ensize=0, total_s
     mins_eta, secs_eta = divmod(int(eta), 60)
     el_m, el_s = divmod(int(elapsed), 60)
 
-    # --- System Stats ---
-    cpu = psutil.cpu_percent(interval=None)
-    ram = psutil.virtual_memory().percent
-    free = psutil.disk_usage('/').free / (1024**3)  # GB
-    uptime_seconds = time.time() - psutil.boot_time()
-    uptime_str = str(datetime.timedelta(seconds=int(uptime_seconds)))
-
     progress_text = f"""<blockquote>‣ <b>Anime Name :</b> <b><i>{file_name}</i></b></blockquote>
 <blockquote>‣ <b>Status :</b> <i>{status}</i>
     {bar}</blockquote>
@@ -48,8 +38,8 @@ async def update_progress(msg, file_name, percent, start_time, ensize=0, total_s
     ‣ <b>Speed :</b> {convertBytes(speed)}/s
     ‣ <b>Time Took :</b> {el_m}m {el_s}s
     ‣ <b>Time Left :</b> {mins_eta}m {secs_eta}s</blockquote>
-<blockquote>‣ <b>System Stats:</b> CPU: {cpu}% | RAM: {ram}% | FREE: {free:.2f}GB | UPTIME: {uptime_str}</blockquote>"""
-    await msg.edit(progress_text)
+<blockquote>‣ <b>System Stats:</b> {sysstats.text()}</blockquote>"""
+    hub.update(msg, progress_text)
 
 # -------------------- Download Helper -------------------- #
 async def download_file(message, path, msg):
@@ -60,7 +50,7 @@ async def download_file(message, path, msg):
         nonlocal last_update
         percent = (current / total) * 100
         now = time.time()
-        if now - last_update >= 10:  # update every 10s
+        if now - last_update >= 1:  # the progress hub paces the edits
             await update_progress(
                 msg,
                 message.document.file_name if message.document else message.video.file_name,
@@ -87,7 +77,7 @@ async def upload_file(client, chat_id, path, msg, caption):
         nonlocal last_update
         percent = (current / total_size) * 100
         now = time.time()
-        if now - last_update >= 10:
+        if now - last_update >= 1:
             await update_progress(
                 msg,
                 os.path.basename(path),
@@ -119,38 +109,28 @@ async def queue_runner(client):
             # -------------------- Download -------------------- #
             await msg.edit(f"⏳ **Downloading {filename}...**")
             await download_file(encoder.message, encoder.dl_path, msg)
+            hub.finish(msg)
             await msg.edit(f"⬇️ **Download completed. Starting 720p encoding...**")
 
             # -------------------- Encoding -------------------- #
+            if ffpool.is_full:
+                await msg.edit(f"⏳ **Waiting for a free encode slot: {filename}**")
+            await ffpool.acquire(f"manual:{filename}")
             encode_task = create_task(encoder.start_encode())
 
-            while not ospath.exists(encoder._FFEncoder__prog_file):
-                await asyncio.sleep(1)
-
             start_time = time.time()
-            last_update = 0
 
-            while not encode_task.done():
+            async for prog in encoder.ffprogress:
                 try:
-                    async with aiofiles.open(encoder._FFEncoder__prog_file, "r") as f:
-                        text = await f.read()
-                        if text:
-                            t = [int(x) for x in findall(r"out_time_ms=(\d+)", text)]
-                            s = [int(x) for x in findall(r"total_size=(\d+)", text)]
-                            time_done = t[-1]/1000000 if t else 0
-                            ensize = s[-1] if s else 0
-                            total_size = ensize * (encoder._FFEncoder__total_time / max(time_done, 1))
-                            percent = min((time_done/encoder._FFEncoder__total_time)*100, 100)
-
-                            now = time.time()
-                            if now - last_update >= 10:
-                                await update_progress(msg, filename, percent, start_time, ensize, total_size, status="Encoding")
-                                last_update = now
+                    total_time = encoder.total_time or max(prog.time_done, 1)
+                    total_size = prog.total_size * (total_time / max(prog.time_done, 1))
+                    percent = min((prog.time_done/total_time)*100, 100)
+                    await update_progress(msg, filename, percent, start_time, prog.total_size, total_size, status="Encoding")
                 except Exception as e:
                     LOGS.error(f"Progress read error: {str(e)}")
-                await asyncio.sleep(1)
 
             output_path = await encode_task
+            ffpool.release(f"manual:{filename}")
 
             # -------------------- Upload -------------------- #
             await upload_file(
@@ -166,6 +146,7 @@ async def queue_runner(client):
             except Exception as e:
                 LOGS.error(f"GDrive upload failed for {filename}: {str(e)}")
 
+            hub.finish(msg)
             await msg.edit(f"✅ **Processing finished: {filename}**")
 
             # Auto-delete
@@ -176,9 +157,11 @@ async def queue_runner(client):
 
         except Exception as e:
             LOGS.error(f"Queue task failed: {filename} | {str(e)}")
+            hub.finish(msg)
             await msg.edit(f"❌ **Task failed: {filename}**")
 
         finally:
+            ffpool.release(f"manual:{filename}")
             ff_queued.pop(filename, None)
             ffQueue.task_done()
 
@@ -1,9 +1,11 @@
 from json import loads as jloads
 from os import path as ospath, execl
 from sys import executable
-from aiohttp import ClientSession
-from bot import Var, bot, ffQueue
-from bot.core.text_utils import TextEditor
+from bot import Var, bot
+from bot.core.text_utils import TextEditor, batch_anidata
+from bot.core.ffpool import ffpool
+from bot.core.http_utils import http
+from bot.core.deliveries import deliveries
 from bot.core.reporter import rep
 from bot.core import tguploader, gdrive_uploader  # Added
 
@@ -15,21 +17,21 @@ import os
 async def upcoming_animes():
     if Var.SEND_SCHEDULE:
         try:
-            async with ClientSession() as ses:
-                res = await ses.get("https://subsplease.org/api/?f=schedule&h=true&tz=Asia/Kolkata")
+            async with http.session.get("https://subsplease.org/api/?f=schedule&h=true&tz=Asia/Kolkata") as res:
                 aniContent = jloads(await res.text())["schedule"]
             text = "<b>📆 Today's Anime Releases Schedule [IST]</b>\n\n"
-            for i in aniContent:
-                aname = TextEditor(i["title"])
-                await aname.load_anilist()
-                text += f''' <a href="https://subsplease.org/shows/{i['page']}">{aname.adata.get('title', {}).get('english') or i['title']}</a>\n    • <b>Time</b> : {i["time"]} hrs\n\n'''
+            adatas = await batch_anidata([await TextEditor(i["title"]).parse_name() for i in aniContent])
+            for i, adata in zip(aniContent, adatas):
+                text += f''' <a href="https://subsplease.org/shows/{i['page']}">{adata.get('title', {}).get('english') or i['title']}</a>\n    • <b>Time</b> : {i["time"]} hrs\n\n'''
             TD_SCHR = await bot.send_message(Var.MAIN_CHANNEL, text)
             await (await TD_SCHR.pin()).delete()
         except Exception as err:
             await rep.report(str(err), "error")
-    if not ffQueue.empty():
-        await ffQueue.join()
+    await ffpool.join()
     await rep.report("Auto Restarting..!!", "info")
+    await rep.drain()
+    await deliveries.flush()
+    await http.close()
     execl(executable, executable, "-m", "bot")
 
 async def update_shdr(name, link):
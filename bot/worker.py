@@ -0,0 +1,130 @@
+from os import path as ospath, getpid, makedirs
+from socket import gethostname
+from time import time
+from asyncio import Semaphore, sleep as asleep
+from aiofiles.os import remove as aioremove
+from aioshutil import move as aiomove
+from traceback import format_exc
+
+from bot import Var, bot_loop, LOGS
+from bot.core.database import db
+from bot.core.ffencoder import FFEncoder, ff_mergeable, ffargs
+from bot.core.tordownload import TorDownloader
+
+class EncodeWorker:
+    """
+    Claims encode jobs from the Mongo queue, keeps their lease alive with a
+    heartbeat while encoding, and leaves the outputs in JOB_SHARE/<job id>.
+    A job whose lease lapses (worker died) is handed to the next worker.
+    """
+    def __init__(self, slots):
+        self.__id = f"{gethostname()}:{getpid()}"
+        self.__sem = Semaphore(max(1, slots))
+
+    async def start(self):
+        LOGS.info(f"Encode Worker {self.__id} Started with {Var.FF_SLOTS} Slot(s)")
+        while True:
+            await self.__sem.acquire()
+            try:
+                job = await db.claimJob(self.__id, time(), Var.JOB_LEASE)
+            except Exception as e:
+                LOGS.error(f"Job Claim Failed: {e}")
+                job = None
+            if not job:
+                self.__sem.release()
+                await asleep(Var.JOB_POLL)
+                continue
+            if job['attempts'] > Var.JOB_RETRIES:
+                await db.endJob(job['_id'], self.__id, 'failed', error="Too Many Attempts")
+                self.__sem.release()
+                continue
+            bot_loop.create_task(self.__run(job))
+
+    async def __heartbeat(self, job, state):
+        last_beat = time()
+        while not state.get('finished'):
+            await asleep(max(1, Var.JOB_LEASE / 3))
+            if state.get('finished'):
+                return
+            encoder = state.get('encoder')
+            progress = {'qual': state.get('qual'), 'percent': 0}
+            if encoder and encoder.total_time:
+                progress['percent'] = round(min(100, encoder.ffprogress.time_done / encoder.total_time * 100), 2)
+            try:
+                owned = await db.beatJob(job['_id'], self.__id, time(), Var.JOB_LEASE, progress)
+            except Exception as e:
+                LOGS.error(f"Heartbeat for Job {job['_id']} Failed: {e}")
+                # Past the lease another worker may own the job, stop before both write its outputs
+                owned = time() - last_beat < Var.JOB_LEASE
+            else:
+                if owned:
+                    last_beat = time()
+            if not owned:
+                # Cancelled by the bot, taken over after a missed lease, or unreachable for a whole lease
+                LOGS.warning(f"Lost Job {job['_id']}, Stopping Encode")
+                state['lost'] = True
+                if encoder := state.get('encoder'):
+                    await encoder.cancel_encode()
+                return
+
+    async def __fetch(self, job):
+        if (src := job.get('source')) and ospath.exists(src):
+            return src
+        return await TorDownloader(ospath.join(Var.JOB_SHARE, "downloads")).download(job['torrent'], job['name'])
+
+    async def __run(self, job):
+        state = {}
+        heartbeat = bot_loop.create_task(self.__heartbeat(job, state))
+        outdir = ospath.join(Var.JOB_SHARE, str(job['_id']))
+        src = None
+        try:
+            if not (src := await self.__fetch(job)):
+                raise Exception("Source Fetch Failed")
+            makedirs(outdir, exist_ok=True)
+            filenames = dict(zip(job['quals'], job['names']))
+            # Jobs queued before profiles were carried fall back to this worker's templates
+            profiles = job.get('profiles') or ffargs
+            if Var.FF_MULTI and ff_mergeable(job['quals'], profiles):
+                passes = [(job['quals'], job['names'])]
+            else:
+                passes = list(filenames.items())
+
+            result = {}
+            for qual, name in passes:
+                if state.get('lost'):
+                    return
+                state['qual'] = ", ".join(qual) if isinstance(qual, list) else qual
+                state['encoder'] = FFEncoder(None, src, name, qual, profiles=profiles)
+                out = await state['encoder'].start_encode()
+                if state.get('lost'):
+                    return
+                if not out:
+                    raise Exception(f"Encode Failed ({state['qual']})")
+                for q, path in (out.items() if isinstance(out, dict) else [(qual, out)]):
+                    result[q] = ospath.abspath(ospath.join(outdir, filenames[q]))
+                    # JOB_SHARE may be another filesystem (NFS etc.), so move rather than rename
+                    await aiomove(path, result[q])
+
+            state['finished'] = True
+            await db.endJob(job['_id'], self.__id, 'done', result=result)
+            LOGS.info(f"Job {job['_id']} Done : {', '.join(result)}")
+        except Exception as e:
+            state['finished'] = True
+            LOGS.error(format_exc())
+            retry = job['attempts'] < Var.JOB_RETRIES
+            await db.endJob(job['_id'], self.__id, 'queued' if retry else 'failed', error=str(e))
+        finally:
+            state['finished'] = True
+            heartbeat.cancel()
+            self.__sem.release()
+            # Only a source this worker fetched itself is its to delete
+            if src and src != job.get('source') and ospath.exists(src):
+                await aioremove(src)
+
+async def main():
+    makedirs(Var.JOB_SHARE, exist_ok=True)
+    await db.ensure_indexes()
+    await EncodeWorker(Var.FF_SLOTS).start()
+
+if __name__ == '__main__':
+    bot_loop.run_until_complete(main())